@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+"""
+@Time    :   2026/10/18 20:14:08
+@Author  :   agent
+@Description  : snippets包热点函数的micro benchmark，输出吞吐以及内存峰值，并可以和保存的baseline对比
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections.abc import Callable
+from datetime import datetime
+
+import click
+import numpy as np
+
+from snippets.decorators import multi_thread
+from snippets.evaluate import pr_statistic
+from snippets.utils import get_batched_data, groupby, jdump_lines, jdumps, jload, jload_lines
+
+SIZES = dict(small=1_000, medium=100_000, large=1_000_000)
+LABELS = [f"label_{i}" for i in range(50)]
+WORDS = ["alpha", "beta", "gamma", "delta", "中文", "数据", "snippets", "benchmark"]
+
+
+# 按照data/sample.jsonl的结构(短key、int value的dict)构造数据，并加入文本、list以及嵌套dict模拟真实数据
+def build_records(num: int, seed=0) -> list[dict]:
+    rng = random.Random(seed)
+    records = []
+    for i in range(num):
+        records.append(
+            dict(
+                a=i,
+                b=rng.randint(0, 1000),
+                c=rng.choice(LABELS),
+                text=" ".join(rng.choices(WORDS, k=rng.randint(5, 30))),
+                scores=[rng.random() for _ in range(4)],
+                meta=dict(source=rng.choice(["web", "app", "api"]), ts=1700000000 + i),
+            )
+        )
+    return records
+
+
+# 构造带numpy、set、datetime的数据，覆盖PythonObjectEncoder.default的分支
+def build_python_objects(num: int, seed=0) -> list[dict]:
+    rng = np.random.default_rng(seed)
+    now = datetime(2024, 1, 1)
+    return [dict(a=np.int64(i), b=np.float32(rng.random()), c=rng.random(4), d={i, i + 1}, e=now) for i in range(num)]
+
+
+# 构造(样本id, label, span)形式的预测集合，约80%的预测正确
+def build_spans(num: int, seed=0) -> tuple[list, list]:
+    rng = random.Random(seed)
+    true_sets = [(i // 5, rng.choice(LABELS), i) for i in range(num)]
+    pred_sets = [e if rng.random() < 0.8 else (e[0], rng.choice(LABELS), e[2]) for e in true_sets]
+    return true_sets, pred_sets
+
+
+def identity(x):
+    return x
+
+
+def build_benchmarks(num: int, tmp_dir: str) -> dict[str, tuple[Callable, int]]:
+    """返回{名称: (无参函数, 处理的数据条数)}"""
+    records = build_records(num)
+    python_objects = build_python_objects(num)
+    true_sets, pred_sets = build_spans(num)
+    jsonl_path = os.path.join(tmp_dir, "records.jsonl")
+    jdump_lines(records, jsonl_path)
+    json_path = os.path.join(tmp_dir, "records.json")
+    with open(json_path, mode="w", encoding="utf8") as f:
+        f.write(jdumps(records))
+    thread_fn = multi_thread(work_num=4, return_list=True)(identity)
+
+    return dict(
+        jload_lines=(lambda: jload_lines(jsonl_path), num),
+        jload=(lambda: jload(json_path), num),
+        jdump_lines=(lambda: jdump_lines(records, os.path.join(tmp_dir, "dump.jsonl")), num),
+        python_object_encoder=(lambda: [jdumps(e, indent=None) for e in python_objects], num),
+        groupby=(lambda: groupby(records, key=lambda x: x["c"]), num),
+        get_batched_data=(lambda: sum(1 for _ in get_batched_data(records, 32)), num),
+        pr_statistic=(lambda: pr_statistic(true_sets, pred_sets), num),
+        multi_thread=(lambda: thread_fn(records[: min(num, 10_000)]), min(num, 10_000)),
+    )
+
+
+def run_benchmark(func: Callable, item_num: int, repeat: int) -> dict:
+    costs = []
+    for _ in range(repeat):
+        st = time.perf_counter()
+        func()
+        costs.append(time.perf_counter() - st)
+    # 内存峰值单独跑一次，避免tracemalloc影响耗时
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    best = min(costs)
+    return dict(items=item_num, best=best, median=float(np.median(costs)), throughput=item_num / best, peak_mb=peak / 2**20)
+
+
+@click.command()
+@click.option("--size", "-s", default="small", type=click.Choice(list(SIZES)), help="数据集大小")
+@click.option("--repeat", "-r", default=5, type=int, help="每个benchmark重复的次数")
+@click.option("--filter", "-k", "name_filter", default=None, help="只跑名称包含该字符串的benchmark")
+@click.option("--save", default=None, help="将结果保存为baseline文件")
+@click.option("--compare", default=None, help="与baseline文件对比")
+@click.option("--threshold", default=0.1, type=float, help="吞吐下降超过该比例时认为变慢，以非0状态码退出")
+def main(size, repeat, name_filter=None, save=None, compare=None, threshold=0.1):
+    from snippets.utils import jdump
+
+    num = SIZES[size]
+    results = dict()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, (func, item_num) in build_benchmarks(num, tmp_dir).items():
+            if name_filter and name_filter not in name:
+                continue
+            rs = run_benchmark(func, item_num, repeat)
+            results[name] = rs
+            print(f"{name:<24}{rs['throughput']:>14,.0f} items/s{rs['best'] * 1000:>12.2f} ms{rs['peak_mb']:>10.2f} MB")
+
+    report = dict(size=size, python=sys.version.split()[0], results=results)
+    if save:
+        jdump(report, save)
+        print(f"baseline saved to {save}")
+
+    if compare:
+        baseline = jload(compare)
+        if baseline["size"] != size:
+            raise click.BadParameter(f"baseline size {baseline['size']} != {size}")
+        slower = []
+        print(f"\ncompare with {compare}")
+        for name, rs in results.items():
+            if name not in baseline["results"]:
+                continue
+            base = baseline["results"][name]
+            change = rs["throughput"] / base["throughput"] - 1
+            mem_change = rs["peak_mb"] / base["peak_mb"] - 1 if base["peak_mb"] else 0.0
+            flag = " SLOWER" if change < -threshold else ""
+            print(f"{name:<24}throughput:{change:+8.2%}  peak memory:{mem_change:+8.2%}{flag}")
+            if flag:
+                slower.append(name)
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+"""
+@Time    :   2026/10/18 20:13:39
+@Author  :   agent
+@Description  : 对比多次压测的结果，出现性能回退时以非0状态码退出
+"""
+
+import sys
+
+import click
+
+from snippets.perf import compare_perf_results
+
+
+@click.command()
+@click.option("--threshold", "-t", default=0.05, type=float, help="判定回退的相对变化阈值")
+@click.option("--confidence", "-c", default=0.95, type=float, help="置信度")
+@click.option("--metric", "-m", "metrics", multiple=True, default=["mean", "p50", "p90", "p99"], help="对比的指标")
+@click.argument("baseline_path")
+@click.argument("candidate_paths", nargs=-1, required=True)
+def main(baseline_path, candidate_paths, threshold=0.05, confidence=0.95, metrics=("mean", "p50", "p90", "p99")):
+    reports = compare_perf_results(baseline_path, list(candidate_paths), metrics=metrics, threshold=threshold, confidence=confidence)
+    for report in reports:
+        print(f"{report['path']} vs {report['baseline_path']}, mann_whitney_p:{report['mann_whitney_p']:.4g}")
+        if report["qps_change"] is not None:
+            print(f"qps change:{report['qps_change']:+.2%}{' REGRESSION' if report['qps_regression'] else ''}")
+        for metric, rs in report["metrics"].items():
+            print(
+                f"{metric}: {rs['baseline']:.4f} -> {rs['candidate']:.4f}, change:{rs['change']:+.2%}, "
+                f"ci:[{rs['ci_low']:+.2%}, {rs['ci_high']:+.2%}]{' REGRESSION' if rs['regression'] else ''}"
+            )
+    if any(report["regression"] for report in reports):
+        print("performance regression detected")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -9,16 +9,156 @@
 -------------------------------------------------
 """
 
+import importlib
 import os
 
-from snippets.decorators import *
-from snippets.evaluate import *
-from snippets.logs import *
-from snippets.mixin import *
-from snippets.perf import *
-from snippets.utils import *
-
 __version__ = "0.1.3"
 
 SNIPPETS_ENV = os.environ.get("SNIPPETS_ENV", "prod")
-logger = set_logger(SNIPPETS_ENV, __name__)
+
+# 子模块以及其中公开的名称，通过PEP 562的__getattr__在第一次访问时才导入对应的子模块
+_SUBMODULE_ATTRS = {
+    "snippets.decorators": [
+        "log_cost_time",
+        "LogCostContext",
+        "log_function_info",
+        "asyncify",
+        "ensure_file_path",
+        "ensure_dir_path",
+        "discard_kwarg",
+        "adapt_single",
+        "RetryBudget",
+        "retry",
+        "multi_thread",
+        "batch_process",
+        "AsyncRateLimiter",
+        "multi_async",
+        "get_process_pool",
+        "shutdown_process_pools",
+        "multi_process",
+    ],
+    "snippets.evaluate": [
+        "get_f1",
+        "get_pr",
+        "get_tp_fp_fn_set",
+        "eval_sets",
+        "get_micro_avg",
+        "get_macro_avg",
+        "PREvaluator",
+        "pr_statistic",
+    ],
+    "snippets.logs": [
+        "LoguruFormat",
+        "QueuedFileSink",
+        "LogRouter",
+        "handlers",
+        "router",
+        "queued_sinks",
+        "get_sink_stats",
+        "set_logger",
+        "get_handler",
+        "update_level",
+        "ChangeLogLevelContext",
+        "change_log_level",
+    ],
+    "snippets.mixin": ["ConfigMixin"],
+    "snippets.perf": [
+        "default_build_req",
+        "default_build_resp",
+        "configure_http_session",
+        "get_http_session",
+        "req_http_service_detail",
+        "get_async_http_client",
+        "async_req_http_service_detail",
+        "LatencyStats",
+        "PerfRecorder",
+        "perf_test",
+        "ramp_profile",
+        "iter_send_times",
+        "open_loop_perf_test",
+        "load_perf_result",
+        "mann_whitney_u",
+        "compare_perf_results",
+    ],
+    "snippets.spans": ["Span", "Tracer", "get_tracer", "set_tracer", "span", "trace_span"],
+    "snippets.utils": [
+        "create_dir_path",
+        "COMPRESSION_SUFFIXES",
+        "split_suffix",
+        "open_file",
+        "PythonObjectEncoder",
+        "jdumps",
+        "jdump",
+        "dump_lines",
+        "jdump_lines",
+        "JsonlWriter",
+        "as_python_object",
+        "jload",
+        "jloads",
+        "jload_lines",
+        "JsonlIndex",
+        "TABLE_SUFFIXES",
+        "table2json",
+        "dump2table",
+        "load_lines",
+        "read2list",
+        "iter_read2list",
+        "iter_load",
+        "dump2list",
+        "dump_list",
+        "load2list",
+        "dump",
+        "load",
+        "estimate_size",
+        "LoadCache",
+        "set_load_cache",
+        "get_load_cache",
+        "load_with_cache",
+        "load_with_shared_cache",
+        "pretty_floats",
+        "get_batched_data",
+        "batchify",
+        "seq2dict",
+        "get_current_time_str",
+        "execute_cmd",
+        "flat",
+        "groupby",
+        "star_surround_info",
+        "print_info",
+        "union_parse_obj",
+        "get_latest_version",
+        "get_next_version",
+        "deep_update",
+        "delete_paths",
+        "batch_process_with_save",
+        "add_callback2gen",
+    ],
+}
+_ATTR2MODULE = {attr: module for module, attrs in _SUBMODULE_ATTRS.items() for attr in attrs}
+
+__all__ = list(_ATTR2MODULE) + ["logger"]
+
+
+# 第一次通过snippets访问公开名称时才设置logger，而不是在import时
+def _get_logger():
+    if "logger" not in globals():
+        from snippets.logs import set_logger
+
+        globals()["logger"] = set_logger(SNIPPETS_ENV, __name__)
+    return globals()["logger"]
+
+
+def __getattr__(name):
+    if name == "logger":
+        return _get_logger()
+    if name not in _ATTR2MODULE:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    _get_logger()
+    value = getattr(importlib.import_module(_ATTR2MODULE[name]), name)
+    # 缓存到模块中，之后的访问不再经过__getattr__
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
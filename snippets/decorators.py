@@ -10,24 +10,32 @@
 """
 
 import asyncio
+import atexit
+import collections
 import inspect
+import itertools
+import math
 import os
 import random
+import reprlib
+import threading
 import time
-from collections.abc import Generator, Iterable
-from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
-from functools import wraps
+from collections.abc import Generator, Iterable, Iterator
+from concurrent.futures import FIRST_COMPLETED, Executor, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from functools import partial, wraps
 
 from loguru import logger as default_logger
-from tqdm import tqdm
+
+from snippets.spans import get_tracer
 
 
 # 输出function执行耗时的函数
-def log_cost_time(name=None, level="INFO", logger=None, star_len=0):
+def log_cost_time(name=None, level="INFO", logger=None, star_len=0, record_span=False):
     def wrapper(func):
         @wraps(func)
         def wrapped(*args, **kwargs):
-            with LogCostContext(name=name if name else func.__name__, level=level, star_len=star_len, logger=logger):
+            name_ = name if name else func.__name__
+            with LogCostContext(name=name_, level=level, star_len=star_len, logger=logger, record_span=record_span):
                 res = func(*args, **kwargs)
             return res
 
@@ -40,62 +48,151 @@ def log_cost_time(name=None, level="INFO", logger=None, star_len=0):
 
 
 class LogCostContext:
-    def __init__(self, name, level="INFO", logger=None, star_len=0):
+    def __init__(self, name, level="INFO", logger=None, star_len=0, record_span=False):
         self.name = name
         self.level = level
         self.star_len = star_len
         self.logger = logger if logger else default_logger
+        self.record_span = record_span
+        self._span_context = None
 
     def __enter__(self):
         msg = f"{self.name} starts"
         half_star_len = max((self.star_len - len(msg)) // 2, 0)
         msg = "*" * half_star_len + msg + "*" * half_star_len
         self.logger.log(self.level, msg)
-        self.st = time.time()
+        # record_span为True时同时记录一个span，可以通过snippets.spans.get_tracer()做层级以及聚合分析
+        if self.record_span:
+            self._span_context = get_tracer().span(self.name)
+            self._span_context.__enter__()
+        self.st = time.perf_counter()
 
     def __exit__(self, type, value, traceback):
-        cost = time.time() - self.st
+        cost = time.perf_counter() - self.st
+        if self._span_context is not None:
+            self._span_context.__exit__(type, value, traceback)
+            self._span_context = None
         msg = f"{self.name} ends, cost:{cost:4.3f} seconds"
         half_star_len = max((self.star_len - len(msg)) // 2, 0)
         msg = "*" * half_star_len + msg + "*" * half_star_len
         self.logger.log(self.level, msg)
 
 
+# 调用采样器，每sample_every次调用采样一次，且每秒最多采样max_per_second次
+class _CallSampler:
+    def __init__(self, sample_every: int = None, max_per_second: float = None):
+        self.sample_every = sample_every
+        self.max_per_second = max_per_second
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._window_start = 0.0
+        self._window_count = 0
+
+    def __call__(self) -> bool:
+        if self.sample_every and next(self._counter) % self.sample_every:
+            return False
+        if self.max_per_second:
+            now = time.monotonic()
+            with self._lock:
+                if now - self._window_start >= 1:
+                    self._window_start = now
+                    self._window_count = 0
+                if self._window_count >= self.max_per_second:
+                    return False
+                self._window_count += 1
+        return True
+
+
+# 有界的repr，容器只格式化前面若干个元素，字符串以及bytes只格式化首尾，超大的参数不会被完整格式化
+class _BoundedRepr(reprlib.Repr):
+    def __init__(self, max_bytes: int):
+        super().__init__()
+        # 每个字符至少占一个字节，按字符数限制格式化的长度即可覆盖max_bytes
+        self.maxstring = self.maxother = self.maxlong = max(max_bytes, 10)
+        item_num = max(max_bytes // 4, 1)
+        self.maxlist = self.maxtuple = self.maxdict = self.maxset = self.maxfrozenset = self.maxdeque = self.maxarray = item_num
+
+    def repr_bytes(self, x, level):
+        if len(x) <= self.maxstring:
+            return repr(x)
+        return f"{repr(x[: self.maxstring])}...({len(x)} bytes)"
+
+    repr_bytearray = repr_bytes
+
+
+# 将对象转成字符串，设置了max_bytes时使用有界的repr，结果utf8编码后超过max_bytes的部分截断
+def _truncate_str(obj, max_bytes: int = None, bounded_repr: reprlib.Repr = None) -> str:
+    if not max_bytes:
+        return str(obj)
+    s = (bounded_repr or _BoundedRepr(max_bytes)).repr(obj)
+    encoded = s.encode("utf8")
+    if len(encoded) > max_bytes:
+        # 截断位置可能落在多字节字符中间，丢弃不完整的字符
+        s = f"{encoded[:max_bytes].decode('utf8', errors='ignore')}...[truncated]"
+    return s
+
+
 # 执行函数时输出函数的参数以及返回值
-def log_function_info(input_level="DEBUG", result_level="DEBUG", exclude_self=True):
+def log_function_info(input_level="DEBUG", result_level="DEBUG", exclude_self=True, sample_every=None, max_per_second=None, max_bytes=None):
+    """执行函数时输出函数的参数以及返回值。参数和返回值只在对应level开启时才会被格式化
+
+    Args:
+        input_level (str, optional): 输出参数的日志级别，为空则不输出. Defaults to "DEBUG".
+        result_level (str, optional): 输出返回值的日志级别，为空则不输出. Defaults to "DEBUG".
+        exclude_self (bool, optional): 是否不输出第一个参数(self). Defaults to True.
+        sample_every (int, optional): 每sample_every次调用输出一次，为空则每次都输出. Defaults to None.
+        max_per_second (float, optional): 每秒最多输出的调用次数，为空则不限制. Defaults to None.
+        max_bytes (int, optional): 参数以及返回值utf8编码后的最大字节数，使用有界的repr，超大的参数不会被完整格式化. Defaults to None.
+    """
+
     def wrapper(func):
         is_async = inspect.iscoroutinefunction(func)
+        func_name = func.__name__
+        sampler = _CallSampler(sample_every, max_per_second) if sample_every or max_per_second else None
+        lazy_logger = default_logger.opt(lazy=True)
+        bounded_repr = _BoundedRepr(max_bytes) if max_bytes else None
 
         def show_args(*args, **kwargs):
             if input_level:
                 show_args = args
                 if exclude_self and len(args) > 1:
                     show_args = args[1:]
-                msg = f"call function:{func.__name__} with\nargs:{show_args}\nkwargs:{kwargs}"
-                default_logger.info(msg)
-                # default_logger.log(input_level, msg)
+                lazy_logger.log(
+                    input_level,
+                    "call function:{} with\nargs:{}\nkwargs:{}",
+                    lambda: func_name,
+                    lambda: _truncate_str(show_args, max_bytes, bounded_repr),
+                    lambda: _truncate_str(kwargs, max_bytes, bounded_repr),
+                )
 
         def show_result(res):
             if result_level:
-                msg = f"function:{func.__name__} return with:\n{res}"
-                default_logger.log(result_level, msg)
+                lazy_logger.log(
+                    result_level, "function:{} return with:\n{}", lambda: func_name, lambda: _truncate_str(res, max_bytes, bounded_repr)
+                )
             return res
 
         if is_async:
 
             @wraps(func)
             async def wrapped_func(*args, **kwargs):
-                show_args(*args, **kwargs)
+                sampled = sampler is None or sampler()
+                if sampled:
+                    show_args(*args, **kwargs)
                 res = await func(*args, **kwargs)
-                show_result(res)
+                if sampled:
+                    show_result(res)
                 return res
         else:
 
             @wraps(func)
             def wrapped_func(*args, **kwargs):
-                show_args(*args, **kwargs)
+                sampled = sampler is None or sampler()
+                if sampled:
+                    show_args(*args, **kwargs)
                 res = func(*args, **kwargs)
-                show_result(res)
+                if sampled:
+                    show_result(res)
                 return res
 
         return wrapped_func
@@ -170,44 +267,161 @@ def adapt_single(ele_name: str):
     return wrapper
 
 
+class RetryBudget:
+    """进程内共享的重试预算，多个被retry装饰的函数可以共用一个，避免下游故障时重试放大流量
+    采用令牌桶: 每次重试消耗一个令牌，每次成功调用补充ratio个令牌，最多max_tokens个。令牌不足时不再重试，直接抛出异常
+
+    Args:
+        max_tokens (float, optional): 令牌上限，也是初始令牌数. Defaults to 10.
+        ratio (float, optional): 每次成功调用补充的令牌数，即稳定状态下允许的重试比例. Defaults to 0.1.
+    """
+
+    def __init__(self, max_tokens: float = 10, ratio: float = 0.1):
+        self.max_tokens = max_tokens
+        self.ratio = ratio
+        self.tokens = max_tokens
+        self._lock = threading.Lock()
+
+    def acquire(self) -> bool:
+        with self._lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+    def deposit(self):
+        with self._lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+
 # 自动加上重试功能
 
 
-def retry(retry_num: int, wait_time: float | tuple[float, float], level="INFO"):
+def retry(
+    retry_num: int,
+    wait_time: float | tuple[float, float],
+    level="INFO",
+    backoff: float = 1.0,
+    max_wait: float = None,
+    jitter=False,
+    exceptions: type[Exception] | tuple[type[Exception], ...] = Exception,
+    budget: RetryBudget = None,
+):
+    """函数失败时自动重试的装饰器，支持同步函数以及async函数
+
+    Args:
+        retry_num (int): 最大重试次数
+        wait_time (float | tuple[float, float]): 首次重试前的等待时间，tuple表示在区间内均匀采样
+        level (str, optional): 重试日志的级别. Defaults to "INFO".
+        backoff (float, optional): 指数退避的倍数，第k次重试等待wait_time * backoff**k秒. Defaults to 1.0.
+        max_wait (float, optional): 单次等待时间的上限. Defaults to None.
+        jitter (bool, optional): 是否使用full jitter，即在[0, 等待时间]内均匀采样. Defaults to False.
+        exceptions (optional): 需要重试的异常类型，其他异常直接抛出. Defaults to Exception.
+        budget (RetryBudget, optional): 共享的重试预算，预算耗尽时不再重试. Defaults to None.
+    """
+
+    def get_wait_time(attempt: int) -> float:
+        if isinstance(wait_time, tuple) or isinstance(wait_time, list):
+            wt = random.uniform(wait_time[0], wait_time[1])
+        else:
+            wt = wait_time
+        wt *= backoff**attempt
+        if max_wait is not None:
+            wt = min(wt, max_wait)
+        if jitter:
+            wt = random.uniform(0, wt)
+        return wt
+
+    def on_failure(func, e: Exception, attempt: int) -> float:
+        """判断是否需要重试，需要时返回等待时间，否则抛出异常"""
+        if not isinstance(e, exceptions):
+            raise e
+        if attempt >= retry_num:
+            default_logger.warning("no attempts left, throw exception")
+            default_logger.exception(e)
+            raise e
+        if budget and not budget.acquire():
+            default_logger.warning(f"retry budget exhausted, throw exception of {func.__name__}")
+            raise e
+        wt = get_wait_time(attempt)
+        default_logger.log(level, f"retry {func.__name__}, {retry_num - attempt} attempts left, sleep:{wt:2.3f} seconds")
+        return wt
+
     def wrapper(func):
-        @wraps(func)
-        def wrapped(*args, **kwargs):
-            num_left = retry_num
+        if inspect.iscoroutinefunction(func):
 
-            while True:
-                try:
-                    return func(*args, **kwargs)
-                except Exception as e:
-                    if num_left == 0:
-                        default_logger.warning("no attempts left, throw exception")
-                        default_logger.exception(e)
-                        raise e
-                    if isinstance(wait_time, tuple) or isinstance(wait_time, list):
-                        wt = random.uniform(wait_time[0], wait_time[1])
-                    else:
-                        wt = wait_time
+            @wraps(func)
+            async def wrapped(*args, **kwargs):
+                attempt = 0
+                while True:
+                    try:
+                        rs = await func(*args, **kwargs)
+                    except Exception as e:
+                        await asyncio.sleep(on_failure(func, e, attempt))
+                        attempt += 1
+                        continue
+                    if budget:
+                        budget.deposit()
+                    return rs
 
-                    default_logger.log(level, f"retry {func.__name__}, {num_left} attempts left, sleep:{wt:2.3f} seconds")
-                    time.sleep(wt)
-                    num_left -= 1
+        else:
+
+            @wraps(func)
+            def wrapped(*args, **kwargs):
+                attempt = 0
+                while True:
+                    try:
+                        rs = func(*args, **kwargs)
+                    except Exception as e:
+                        time.sleep(on_failure(func, e, attempt))
+                        attempt += 1
+                        continue
+                    if budget:
+                        budget.deposit()
+                    return rs
 
         return wrapped
 
     return wrapper
 
 
+_EMPTY = object()
+
+
+# 用executor并发执行func，最多同时有max_inflight个任务在执行或者等待被消费
+def _bounded_map(executor: Executor, func, data: Iterable, max_inflight: int, ordered=True) -> Iterator:
+    data_iter = iter(data)
+    pending = collections.deque() if ordered else set()
+    try:
+        while True:
+            while len(pending) < max_inflight:
+                item = next(data_iter, _EMPTY)
+                if item is _EMPTY:
+                    break
+                future = executor.submit(func, item)
+                pending.append(future) if ordered else pending.add(future)
+            if not pending:
+                return
+            if ordered:
+                yield pending.popleft().result()
+            else:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
 # 线程池批量跑function
-def multi_thread(work_num, return_list=False, safe_execute=True):
+def multi_thread(work_num, return_list=False, safe_execute=True, max_inflight=None, ordered=True):
     """多线程跑某个function的装饰器
     Args:
         work_num (_type_): 线程数
         return_list (bool, optional): 结果是否返回list. Defaults to False.
         safe_execute (bool, optional): 是不是catch住function中的exception并返回None. Defaults to True.
+        max_inflight (int, optional): 最多同时提交的任务数，按需从data中取数据，避免大generator一次性提交所有任务. Defaults to 2*work_num.
+        ordered (bool, optional): 是否按照data的顺序返回结果，False时按照完成顺序返回. Defaults to True.
     """
 
     def wrapper(func):
@@ -224,10 +438,15 @@ def multi_thread(work_num, return_list=False, safe_execute=True):
                     else:
                         raise e
 
-            executors = ThreadPoolExecutor(work_num)
-            rs_iter = executors.map(_func, data)
+            def gen():
+                # 迭代结束或者generator被关闭时，取消未开始的任务并关闭线程池
+                with ThreadPoolExecutor(work_num) as executor:
+                    yield from _bounded_map(executor, _func, data, max_inflight or work_num * 2, ordered)
+
+            from tqdm import tqdm
+
             total = None if not hasattr(data, "__len__") else len(data)
-            rs_iter = tqdm(rs_iter, total=total)
+            rs_iter = tqdm(gen(), total=total)
             rs_iter = (e for e in rs_iter if e is not None)
 
             return list(rs_iter) if return_list else rs_iter
@@ -239,19 +458,182 @@ def multi_thread(work_num, return_list=False, safe_execute=True):
 
 batch_process = multi_thread
 
+
+# 异步限流器，保证acquire的速率不超过rate次/秒
+class AsyncRateLimiter:
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self._next_time = 0.0
+
+    async def acquire(self):
+        now = asyncio.get_running_loop().time()
+        slot = max(now, self._next_time)
+        self._next_time = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+# 协程批量跑function
+def multi_async(work_num, return_list=False, safe_execute=True, rate_limit=None, ordered=True):
+    """用asyncio并发跑某个function的装饰器，适合大量IO请求的场景，并发数不受线程数限制
+    Args:
+        work_num (_type_): 最大并发数
+        return_list (bool, optional): 为True时返回协程，await得到结果list；否则返回async generator. Defaults to False.
+        safe_execute (bool, optional): 是不是catch住function中的exception并返回None. Defaults to True.
+        rate_limit (float, optional): 每秒最多发起的调用次数. Defaults to None.
+        ordered (bool, optional): 是否按照data的顺序返回结果，False时按照完成顺序返回. Defaults to True.
+    """
+
+    def wrapper(func):
+        async_func = func if inspect.iscoroutinefunction(func) else asyncify(func)
+
+        async def gen(data: Iterable, *args, **kwargs):
+            semaphore = asyncio.Semaphore(work_num)
+            limiter = AsyncRateLimiter(rate_limit) if rate_limit else None
+
+            async def _func(x):
+                async with semaphore:
+                    if limiter:
+                        await limiter.acquire()
+                    try:
+                        return await async_func(x, *args, **kwargs)
+                    except Exception as e:
+                        if safe_execute:
+                            default_logger.warning(f"function {func.__name__} failed with exception")
+                            default_logger.exception(e)
+                            return None
+                        else:
+                            raise e
+
+            async def aiter_data():
+                if hasattr(data, "__aiter__"):
+                    async for item in data:
+                        yield item
+                else:
+                    for item in data:
+                        yield item
+
+            from tqdm import tqdm
+
+            total = None if not hasattr(data, "__len__") else len(data)
+            data_iter = aiter_data()
+            pending = collections.deque() if ordered else set()
+            exhausted = False
+            with tqdm(total=total) as progbar:
+                try:
+                    while True:
+                        # 最多同时创建2*work_num个task，避免大量数据一次性创建所有task
+                        while not exhausted and len(pending) < work_num * 2:
+                            try:
+                                item = await anext(data_iter)
+                            except StopAsyncIteration:
+                                exhausted = True
+                                break
+                            task = asyncio.create_task(_func(item))
+                            pending.append(task) if ordered else pending.add(task)
+                        if not pending:
+                            return
+                        if ordered:
+                            done = [await pending.popleft()]
+                        else:
+                            done_tasks, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                            done = [task.result() for task in done_tasks]
+                        for rs in done:
+                            progbar.update(1)
+                            if rs is not None:
+                                yield rs
+                finally:
+                    for task in pending:
+                        task.cancel()
+
+        async def collect(agen):
+            return [e async for e in agen]
+
+        @wraps(func)
+        def wrapped(data: Iterable, *args, **kwargs):
+            agen = gen(data, *args, **kwargs)
+            return collect(agen) if return_list else agen
+
+        return wrapped
+
+    return wrapper
+
+
+# 进程池按照进程数复用，进程退出时统一关闭
+_process_pools: dict[int, ProcessPoolExecutor] = dict()
+_process_pools_lock = threading.Lock()
+
+
+def get_process_pool(work_num: int) -> ProcessPoolExecutor:
+    with _process_pools_lock:
+        pool = _process_pools.get(work_num)
+        # 有子进程异常退出时进程池会变成broken状态，需要重建
+        if pool is None or pool._broken:
+            pool = ProcessPoolExecutor(work_num)
+            _process_pools[work_num] = pool
+        return pool
+
+
+@atexit.register
+def shutdown_process_pools():
+    with _process_pools_lock:
+        for pool in _process_pools.values():
+            pool.shutdown(wait=True, cancel_futures=True)
+        _process_pools.clear()
+
+
+# 根据单条数据的耗时估算chunksize，使每个chunk的耗时约为target_chunk_cost秒，同时保证每个进程至少分到几个chunk
+def _estimate_chunksize(item_cost: float, total: int | None, work_num: int, target_chunk_cost=0.05, max_chunksize=1024) -> int:
+    chunksize = int(target_chunk_cost / max(item_cost, 1e-6))
+    if total:
+        chunksize = min(chunksize, math.ceil(total / (work_num * 4)))
+    return max(1, min(chunksize, max_chunksize))
+
+
+# 在子进程中执行func并记录耗时，需要定义在模块级别以便pickle
+def _timed_call(func, item):
+    st = time.perf_counter()
+    rs = func(item)
+    return rs, time.perf_counter() - st
+
+
 # 多进程不可以使用内部定义的function
 
 
-def multi_process(work_num, return_list=False):
+def multi_process(work_num, return_list=False, chunksize=None):
+    """多进程跑某个function的装饰器，进程池在多次调用之间复用
+    Args:
+        work_num (_type_): 进程数
+        return_list (bool, optional): 结果是否返回list. Defaults to False.
+        chunksize (int, optional): 每次发给子进程的数据条数。为None时每个子进程先试跑一条数据，按耗时估算. Defaults to None.
+    """
+
     def wrapper(func):
         @wraps(func)
-        def wrapped(data: Iterable):
-            executors = ProcessPoolExecutor(work_num)
-            rs_iter = executors.map(func, data)
-            rs = rs_iter
+        def wrapped(data: Iterable, *args, **kwargs):
+            task = partial(func, *args, **kwargs) if args or kwargs else func
             total = None if not hasattr(data, "__len__") else len(data)
-            rs_iter = tqdm(rs_iter, total=total)
-            return list(rs_iter) if return_list else rs
+            data_iter = iter(data)
+            if chunksize:
+                rs = get_process_pool(work_num).map(task, data_iter, chunksize=chunksize)
+            else:
+                # 先在子进程中试跑每个进程一条数据，用子进程内的平均耗时估算chunksize
+                pool = get_process_pool(work_num)
+                pilot_futures = [pool.submit(_timed_call, task, e) for e in itertools.islice(data_iter, work_num)]
+                pilot_rs = [future.result() for future in pilot_futures]
+                if pilot_rs:
+                    item_cost = sum(cost for _, cost in pilot_rs) / len(pilot_rs)
+                    rest_total = total - len(pilot_rs) if total is not None else None
+                    cur_chunksize = _estimate_chunksize(item_cost, rest_total, work_num)
+                    default_logger.debug(f"{func.__name__} costs {item_cost:.6f} seconds per item, use {cur_chunksize=}")
+                    rs = itertools.chain((e for e, _ in pilot_rs), pool.map(task, data_iter, chunksize=cur_chunksize))
+                else:
+                    rs = iter([])
+            if not return_list:
+                return rs
+            from tqdm import tqdm
+
+            return list(tqdm(rs, total=total))
 
         return wrapped
 
@@ -6,7 +6,13 @@
 @Contact :   jerrychen1990@gmail.com
 """
 
-from snippets.utils import groupby
+from collections import Counter
+from collections.abc import Callable, Iterable
+from operator import itemgetter
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import numpy as np
 
 
 # 计算f1
@@ -65,22 +71,98 @@ def get_macro_avg(set_eval_list):
     return rs_dict
 
 
+class PREvaluator:
+    """增量的precision/recall测评器。按label维护tp/fp/fn计数，可以边推理边测评，也可以合并多个进程的测评结果
+    label会被映射成整数下标，计数保存在numpy数组中。每个batch内部按集合去重，不同batch之间的元素视为不同的元素
+
+    Args:
+        key (Callable, optional): 从元素中获取label的函数. Defaults to itemgetter(1).
+    """
+
+    def __init__(self, key: Callable = itemgetter(1)):
+        import numpy as np
+
+        self.key = key
+        self.labels = []
+        self._label2idx = dict()
+        self.tp = np.zeros(0, dtype=np.int64)
+        self.fp = np.zeros(0, dtype=np.int64)
+        self.fn = np.zeros(0, dtype=np.int64)
+
+    def _intern(self, label) -> int:
+        idx = self._label2idx.get(label)
+        if idx is None:
+            idx = self._label2idx[label] = len(self.labels)
+            self.labels.append(label)
+        return idx
+
+    def _count(self, items) -> "np.ndarray":
+        import numpy as np
+
+        # 先按label计数，只对不同的label做下标映射
+        label_counter = Counter(map(self.key, items))
+        idxs = [self._intern(label) for label in label_counter]
+        counts = np.zeros(len(self.labels), dtype=np.int64)
+        counts[idxs] = list(label_counter.values())
+        return counts
+
+    def _resize(self):
+        import numpy as np
+
+        pad = len(self.labels) - len(self.tp)
+        if pad > 0:
+            self.tp, self.fp, self.fn = (np.pad(e, (0, pad)) for e in (self.tp, self.fp, self.fn))
+
+    def update(self, true_batch: Iterable, pred_batch: Iterable) -> "PREvaluator":
+        """累加一个batch的测评结果"""
+        import numpy as np
+
+        true_set = set(true_batch)
+        pred_set = set(pred_batch)
+        # fp = pred - tp, fn = true - tp，不需要显式构造fp/fn集合
+        true_count, pred_count, tp_count = (self._count(e) for e in (true_set, pred_set, true_set & pred_set))
+        self._resize()
+        size = len(self.labels)
+        true_count, pred_count, tp_count = (np.pad(e, (0, size - len(e))) for e in (true_count, pred_count, tp_count))
+        self.tp += tp_count
+        self.fp += pred_count - tp_count
+        self.fn += true_count - tp_count
+        return self
+
+    def merge(self, other: "PREvaluator") -> "PREvaluator":
+        """合并另一个测评器的计数"""
+        import numpy as np
+
+        idxs = np.array([self._intern(label) for label in other.labels], dtype=np.int64)
+        self._resize()
+        if len(idxs):
+            self.tp[idxs] += other.tp
+            self.fp[idxs] += other.fp
+            self.fn[idxs] += other.fn
+        return self
+
+    def compute(self) -> dict:
+        """计算各个label以及micro/macro平均的测评结果，格式与pr_statistic一致"""
+        import numpy as np
+
+        tp, fp, fn = self.tp, self.fp, self.fn
+        pred_num, true_num = tp + fp, tp + fn
+        precision = np.divide(tp, pred_num, out=np.zeros(len(tp)), where=pred_num > 0)
+        recall = np.divide(tp, true_num, out=np.zeros(len(tp)), where=true_num > 0)
+        pr_sum = precision + recall
+        f1 = np.divide(2 * precision * recall, pr_sum, out=np.zeros(len(tp)), where=pr_sum > 0)
+
+        columns = zip(tp.tolist(), fp.tolist(), fn.tolist(), precision.tolist(), recall.tolist(), f1.tolist())
+        detail_dict = {
+            label: dict(tp=a, fp=b, fn=c, precision=p, recall=r, f1=f) for label, (a, b, c, p, r, f) in zip(self.labels, columns)
+        }
+        detail_dict = dict(sorted(detail_dict.items(), key=lambda x: x[1]["f1"], reverse=True))
+
+        set_eval_list = detail_dict.values()
+        micro_eval_rs = get_micro_avg(set_eval_list)
+        macro_eval_rs = get_macro_avg(set_eval_list)
+        return dict(detail=detail_dict, micro=micro_eval_rs, macro=macro_eval_rs)
+
+
 def pr_statistic(true_sets, pred_sets):
-    true_label_dict = groupby(true_sets, key=lambda x: x[1])
-    pred_label_dict = groupby(pred_sets, key=lambda x: x[1])
-
-    target_type_set = true_label_dict.keys() | pred_label_dict.keys()
-    detail_dict = dict()
-    for target_type in target_type_set:
-        true_list = true_label_dict.get(target_type, [])
-        true_set = set(true_list)
-        pred_list = pred_label_dict.get(target_type, [])
-        pred_set = set(pred_list)
-        eval_rs = eval_sets(true_set, pred_set)
-        detail_dict[target_type] = eval_rs
-    detail_dict = dict(sorted(detail_dict.items(), key=lambda x: x[1]["f1"], reverse=True))
-    set_eval_list = detail_dict.values()
-    micro_eval_rs = get_micro_avg(set_eval_list)
-    macro_eval_rs = get_macro_avg(set_eval_list)
-    rs_dict = dict(detail=detail_dict, micro=micro_eval_rs, macro=macro_eval_rs)
-    return rs_dict
+    return PREvaluator().update(true_sets, pred_sets).compute()
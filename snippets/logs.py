@@ -6,12 +6,16 @@
 @Contact :   jerrychen1990@gmail.com
 """
 
+import itertools
 import os
+import queue
 import sys
+import threading
 from enum import Enum
 from functools import wraps
 
 from loguru import logger
+from loguru._file_sink import FileSink
 
 
 class LoguruFormat(str, Enum):
@@ -41,15 +45,231 @@ class LoguruFormat(str, Enum):
     )
 
 
-handlers = dict()
+class QueuedFileSink:
+    """非阻塞的文件sink。日志格式化后放入有界队列，由后台线程批量写入文件，调用方不需要等待磁盘IO
+    实际的写入复用loguru的FileSink，rotation/retention的行为与直接添加文件路径一致
+
+    Args:
+        path (str): 日志文件路径
+        rotation (optional): 同loguru. Defaults to None.
+        retention (optional): 同loguru. Defaults to None.
+        queue_size (int, optional): 队列的最大长度. Defaults to 10000.
+        batch_size (int, optional): 每批最多写入的日志条数，每批写完flush一次. Defaults to 512.
+        overflow (str, optional): 队列满时的策略，block: 阻塞调用方直到队列有空位; drop: 丢弃该条日志. Defaults to "block".
+    """
 
+    def __init__(self, path: str, rotation=None, retention=None, queue_size=10000, batch_size=512, overflow="block"):
+        if overflow not in ["block", "drop"]:
+            raise ValueError(f"unknown overflow: {overflow}, should be one of block/drop")
+        # 使用大的缓冲区，由后台线程在每批写完后统一flush
+        self._sink = FileSink(path, rotation=rotation, retention=retention, buffering=1 << 16, encoding="utf8")
+        self.path = path
+        self.batch_size = batch_size
+        self.overflow = overflow
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self.enqueued = self.written = self.dropped = self.batches = self.max_depth = 0
+        self._thread = threading.Thread(target=self._consume, name=f"QueuedFileSink-{path}", daemon=True)
+        self._thread.start()
+
+    def write(self, message):
+        try:
+            if self.overflow == "block":
+                self._queue.put(message)
+            else:
+                self._queue.put_nowait(message)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return
+        with self._lock:
+            self.enqueued += 1
+            self.max_depth = max(self.max_depth, self._queue.qsize())
+
+    def _consume(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = False
+            for message in batch:
+                if message is None:
+                    stop = True
+                    continue
+                self._sink.write(message)
+            if self._sink._file is not None:
+                self._sink._file.flush()
+            with self._lock:
+                self.written += len(batch) - stop
+                self.batches += 1
+            for _ in batch:
+                self._queue.task_done()
+            if stop:
+                return
+
+    def wait(self):
+        """等待队列中已有的日志全部写入文件"""
+        self._queue.join()
+
+    def stop(self):
+        # loguru移除handler时调用
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self._sink.stop()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(
+                path=self.path,
+                enqueued=self.enqueued,
+                written=self.written,
+                dropped=self.dropped,
+                batches=self.batches,
+                queue_depth=self._queue.qsize(),
+                max_depth=self.max_depth,
+            )
+
+
+class LogRouter:
+    """日志路由表。汇总所有handler的module/function过滤条件，将日志分发到target(例如共用的handler)
+    匹配结果按(name, function)缓存，并保存在record上，同一条日志经过多个handler时只计算一次
+
+    Args:
+        max_cache_size (int, optional): 缓存的(name, function)组合的最大数量，超过后清空缓存. Defaults to 100000.
+    """
 
-def set_logger(env: str, module_name: str, std=True, log_dir=None, log_path=None, show_process=False, function_name: str = None):
+    def __init__(self, max_cache_size=100000):
+        self.max_cache_size = max_cache_size
+        self._rules = dict()
+        self._cache = dict()
+        self._lock = threading.Lock()
+        # 每个router在record上使用独立的key，避免多个router互相影响
+        self._record_key = f"_log_routes_{id(self)}"
+
+    def register(self, target, module_name: str = None, function_name: str = None):
+        """将module/function过滤条件路由到target"""
+        with self._lock:
+            self._rules.setdefault((module_name, function_name), set()).add(target)
+            self._cache.clear()
+
+    def unregister(self, target, module_name: str = None, function_name: str = None):
+        with self._lock:
+            targets = self._rules.get((module_name, function_name), set())
+            targets.discard(target)
+            if not targets:
+                self._rules.pop((module_name, function_name), None)
+            self._cache.clear()
+
+    def match(self, name: str, function: str) -> frozenset:
+        """返回与(name, function)匹配的所有target，module/function均为子串匹配"""
+        key = (name, function)
+        matched = self._cache.get(key)
+        if matched is None:
+            with self._lock:
+                matched = frozenset(
+                    target
+                    for (module_name, function_name), targets in self._rules.items()
+                    if (not module_name or module_name in name) and (not function_name or function_name in function)
+                    for target in targets
+                )
+                if len(self._cache) >= self.max_cache_size:
+                    self._cache.clear()
+                self._cache[key] = matched
+        return matched
+
+    def get_filter(self, target):
+        """生成loguru handler使用的filter"""
+        record_key = self._record_key
+
+        def _filter(r):
+            matched = r.get(record_key)
+            if matched is None:
+                # 同一条日志的record在各个handler之间共享，只有第一个handler需要计算
+                matched = r[record_key] = self.match(r["name"], r["function"])
+            return target in matched
+
+        return _filter
+
+    def cache_size(self) -> int:
+        return len(self._cache)
+
+
+handlers = dict()
+# 所有set_logger注册的过滤条件共用的路由表
+router = LogRouter()
+# 队列模式下添加的sink，key与handlers一致
+queued_sinks = dict()
+# sink以及参数都相同的handler共用一个loguru handler，由router按module/function分发，
+# 每条日志只经过一次filter，而不是每个module一次
+_handler_groups = dict()
+# handlers中的key对应的(route, group_key)
+_handler_routes = dict()
+_group_targets = itertools.count()
+
+
+# 添加一个按route过滤的handler，sink以及参数都相同时复用已有的loguru handler
+def _add_routed_handler(key: str, route: tuple, group_key, sink=None, sink_factory=None, **kwargs) -> int:
+    group = _handler_groups.get(group_key)
+    if group is not None and group["handler_id"] not in logger._core.handlers:
+        # 共用的handler被logger.remove移除了，重新添加
+        for stale_route in group["routes"]:
+            router.unregister(group["target"], *stale_route)
+        group = None
+    if group is None:
+        sink = sink_factory() if sink_factory else sink
+        target = next(_group_targets)
+        handler_id = logger.add(sink, filter=router.get_filter(target), **kwargs)
+        group = _handler_groups[group_key] = dict(target=target, handler_id=handler_id, sink=sink, kwargs=kwargs, routes=set())
+    group["routes"].add(route)
+    router.register(group["target"], *route)
+    _handler_routes[key] = (route, group_key)
+    return group["handler_id"]
+
+
+# 将key对应的route从共用的handler中拆出来单独使用一个loguru handler，修改level时不影响其他module
+def _isolate_handler(key: str) -> int:
+    route, group_key = _handler_routes[key]
+    group = _handler_groups[group_key]
+    if len(group["routes"]) <= 1:
+        return handlers[key]
+    group["routes"].discard(route)
+    router.unregister(group["target"], *route)
+    handler_id = _add_routed_handler(key, route, (group_key, key), sink=group["sink"], **group["kwargs"])
+    handlers[key] = handler_id
+    return handler_id
+
+
+def get_sink_stats() -> dict[str, dict]:
+    """获取队列模式下各个文件sink的吞吐以及队列深度统计"""
+    return {key: sink.stats() for key, sink in queued_sinks.items()}
+
+
+def set_logger(
+    env: str,
+    module_name: str,
+    std=True,
+    log_dir=None,
+    log_path=None,
+    show_process=False,
+    function_name: str = None,
+    queued=False,
+    queue_size=10000,
+    batch_size=512,
+    overflow="block",
+):
     """_summary_
 
     Args:
         env (str): environment: dev/test/prod
         log_dir (_type_, optional): target log dir. Defaults to None.
+        queued (bool, optional): 文件日志是否使用QueuedFileSink在后台线程批量写入. Defaults to False.
+        queue_size (int, optional): 队列模式下队列的最大长度. Defaults to 10000.
+        batch_size (int, optional): 队列模式下每批写入的日志条数. Defaults to 512.
+        overflow (str, optional): 队列满时的策略，block或者drop. Defaults to "block".
 
     Returns:
         _type_: loguru logger
@@ -65,73 +285,51 @@ def set_logger(env: str, module_name: str, std=True, log_dir=None, log_path=None
     level = "DEBUG" if env in ["dev", "local"] else "INFO"
     retention = "7 days" if env in ["dev", "local"] else "30 days"
 
-    def filter(r):
-        if module_name and module_name not in r["name"]:
-            return False
-        if function_name and function_name not in r["function"]:
-            return False
-        return True
+    route = (module_name, function_name)
 
-    def _add_handler(key, *args, **kwargs):
-        # logger.info(f"search {key} for {handlers.keys()}")
-        # print(logger._core.handlers)
+    def _add_handler(key, group_key, sink=None, sink_factory=None, **kwargs):
         if key in handlers:
             logger.info(f"handler:{key} already exists")
         else:
-            handler_id = logger.add(*args, **kwargs)
+            handler_id = _add_routed_handler(key, route, group_key, sink=sink, sink_factory=sink_factory, **kwargs)
             handlers[key] = handler_id
             logger.info(f"add handler{handler_id} for {key} with level {kwargs.get('level')}")
 
+    def _add_file_handler(key, path, level):
+        kwargs = dict(backtrace=True, level=level, format=file_fmt)
+        if queued:
+            group_key = ("queued", path, retention, queue_size, batch_size, overflow, tuple(sorted(kwargs.items())))
+
+            def sink_factory():
+                return QueuedFileSink(
+                    path, rotation="00:00", retention=retention, queue_size=queue_size, batch_size=batch_size, overflow=overflow
+                )
+
+            _add_handler(key, group_key, sink_factory=sink_factory, **kwargs)
+            if key in _handler_routes:
+                queued_sinks[key] = _handler_groups[_handler_routes[key][1]]["sink"]
+        else:
+            kwargs.update(rotation="00:00", retention=retention, enqueue=False)
+            _add_handler(key, (path, tuple(sorted(kwargs.items()))), sink=path, **kwargs)
+
     filter_key = module_name if module_name else function_name
 
     if std:
         std_key = f"{filter_key}_stdout"
-        _add_handler(std_key, sys.stdout, colorize=True, format=fmt, level=level, filter=filter, enqueue=False)
+        kwargs = dict(colorize=True, format=fmt, level=level, enqueue=False)
+        _add_handler(std_key, ("stdout", tuple(sorted(kwargs.items()))), sink=sys.stdout, **kwargs)
 
     file_fmt = LoguruFormat.PROCESS_FILE_DETAIL if show_process else LoguruFormat.FILE_DETAIL
 
     if log_path:
-        _add_handler(
-            f"{filter_key}_file_{level}_{log_path}",
-            log_path,
-            rotation="00:00",
-            retention=retention,
-            enqueue=False,
-            backtrace=True,
-            level=level,
-            filter=filter,
-            format=file_fmt,
-        )
-        logger.add(
-            log_path, rotation="00:00", retention=retention, enqueue=False, backtrace=True, level=level, filter=filter, format=file_fmt
-        )
+        _add_file_handler(f"{filter_key}_file_{level}_{log_path}", log_path, level)
     if log_dir:
         os.makedirs(log_dir, exist_ok=True)
         detail_log_path = os.path.join(log_dir, "detail.log")
-        _add_handler(
-            f"{filter_key}_file_DEBUG_{detail_log_path}",
-            detail_log_path,
-            rotation="00:00",
-            retention=retention,
-            enqueue=False,
-            backtrace=True,
-            level="DEBUG",
-            filter=filter,
-            format=file_fmt,
-        )
+        _add_file_handler(f"{filter_key}_file_DEBUG_{detail_log_path}", detail_log_path, "DEBUG")
 
         output_log_path = os.path.join(log_dir, "output.log")
-        _add_handler(
-            f"{filter_key}_file_INFO_{output_log_path}",
-            output_log_path,
-            rotation="00:00",
-            retention=retention,
-            enqueue=False,
-            backtrace=True,
-            level="INFO",
-            filter=filter,
-            format=file_fmt,
-        )
+        _add_file_handler(f"{filter_key}_file_INFO_{output_log_path}", output_log_path, "INFO")
     return logger
 
 
@@ -139,7 +337,8 @@ def get_handler(module_name, sink_type):
     key = "_".join([module_name, sink_type])
     if key not in handlers:
         return None
-    handler_id = handlers[key]
+    # 拿到handler一般是为了修改level，共用的handler需要先拆分出来
+    handler_id = _isolate_handler(key)
     handler = logger._core.handlers[handler_id]
     return handler
 
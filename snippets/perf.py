@@ -7,14 +7,28 @@
 @Contact :   jerrychen1990@gmail.com
 """
 
+import asyncio
+import collections
+import itertools
+import math
 import os
+import random
+import threading
 import time
+import weakref
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
 
-import requests
 from loguru import logger
 
 from snippets.decorators import batch_process
-from snippets.utils import create_dir_path, get_current_time_str, jdump, read2list
+from snippets.utils import JsonlWriter, create_dir_path, get_current_time_str, iter_read2list, read2list
+
+# requests以及numpy在用到时才导入
+if TYPE_CHECKING:
+    import numpy as np
+    import requests
 
 
 def default_build_req(item: dict) -> dict:
@@ -25,42 +39,588 @@ def default_build_resp(http_resp: dict) -> dict:
     return http_resp.json()["data"]
 
 
-def req_http_service_detail(item, url, build_req_func=default_build_req, build_resp_func=default_build_resp) -> dict:
-    st = time.time()
+# 每个线程复用一个带连接池的session，避免每次请求都重新建立TCP/TLS连接
+_session_local = threading.local()
+_session_config = dict(pool_size=10, keep_alive=True, max_retries=0, version=0)
+
+
+def configure_http_session(pool_size: int = 10, keep_alive=True, max_retries: int = 0):
+    """设置get_http_session创建的session的参数，已经创建的session会在下次获取时重建
+
+    Args:
+        pool_size (int, optional): 每个session的连接池大小. Defaults to 10.
+        keep_alive (bool, optional): 是否复用连接. Defaults to True.
+        max_retries (int, optional): 连接失败时的重试次数. Defaults to 0.
+    """
+    _session_config.update(pool_size=pool_size, keep_alive=keep_alive, max_retries=max_retries, version=_session_config["version"] + 1)
+
+
+def get_http_session() -> "requests.Session":
+    session = getattr(_session_local, "session", None)
+    if session is None or _session_local.version != _session_config["version"]:
+        if session is not None:
+            session.close()
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        pool_size = _session_config["pool_size"]
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=_session_config["max_retries"])
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        if not _session_config["keep_alive"]:
+            session.headers["Connection"] = "close"
+        _session_local.session = session
+        _session_local.version = _session_config["version"]
+    return session
+
+
+def req_http_service_detail(
+    item, url, build_req_func=default_build_req, build_resp_func=default_build_resp, session: "requests.Session" = None
+) -> dict:
+    st = time.perf_counter()
 
     req = build_req_func(item)
-    resp = requests.post(url, json=req)
+    session = session if session else get_http_session()
+    resp = session.post(url, json=req)
     resp.raise_for_status()
     resp = build_resp_func(resp)
-    cost = time.time() - st
+    cost = time.perf_counter() - st
     rs = dict(item=item, req=req, resp=resp, cost=cost)
     return rs
 
 
-def perf_test(input_path, url, req_func, output_path=None, work_num=1, max_num=None):
-    logger.info("perf starts")
-    logger.info(f"input_path: {input_path}, url:{url}, work_num:{work_num}")
+# 每个event loop复用一个httpx.AsyncClient
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_http_client(pool_size: int = 100):
+    try:
+        import httpx
+    except ImportError as e:
+        raise ImportError("httpx is required for async http client, please pip install httpx") from e
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        client = httpx.AsyncClient(limits=limits, timeout=None)
+        _async_clients[loop] = client
+    return client
+
+
+async def async_req_http_service_detail(
+    item, url, build_req_func=default_build_req, build_resp_func=default_build_resp, client=None
+) -> dict:
+    st = time.perf_counter()
+
+    req = build_req_func(item)
+    client = client if client else get_async_http_client()
+    resp = await client.post(url, json=req)
+    resp.raise_for_status()
+    resp = build_resp_func(resp)
+    cost = time.perf_counter() - st
+    rs = dict(item=item, req=req, resp=resp, cost=cost)
+    return rs
+
+
+class LatencyStats:
+    """增量统计latency，适用于长时间、大量请求的测试，内存占用与请求数无关
+    mean/std使用Welford算法计算，分位数由对数分桶的直方图估算，相对误差不超过precision。
+    直方图可以跨多次测试merge，也可以通过to_dict/from_dict序列化
+
+    Args:
+        precision (float, optional): 分桶的相对精度. Defaults to 0.01.
+        min_value (float, optional): 最小可分辨的latency(秒)，更小的值都记到第0个桶. Defaults to 1e-6.
+    """
+
+    PERCENTILES = [50, 90, 95, 99, 99.9]
+
+    def __init__(self, precision: float = 0.01, min_value: float = 1e-6):
+        self.precision = precision
+        self.min_value = min_value
+        self._log_base = math.log1p(precision)
+        self.buckets = collections.Counter()
+        self.errors = collections.Counter()
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self._lock = threading.Lock()
+
+    def _bucket_idx(self, value: float) -> int:
+        if value <= self.min_value:
+            return 0
+        return int(math.log(value / self.min_value) / self._log_base) + 1
+
+    def _bucket_value(self, idx: int) -> float:
+        if idx == 0:
+            return self.min_value
+        # 取桶上下界的几何中点
+        return self.min_value * (1 + self.precision) ** (idx - 0.5)
+
+    def record(self, value: float):
+        with self._lock:
+            self.count += 1
+            delta = value - self.mean
+            self.mean += delta / self.count
+            self._m2 += delta * (value - self.mean)
+            self.min = min(self.min, value)
+            self.max = max(self.max, value)
+            self.buckets[self._bucket_idx(value)] += 1
+
+    def record_error(self, error: Exception | str):
+        name = error if isinstance(error, str) else type(error).__name__
+        with self._lock:
+            self.errors[name] += 1
+
+    @property
+    def error_num(self) -> int:
+        return sum(self.errors.values())
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self._m2 / self.count) if self.count else 0.0
+
+    def percentile(self, q: float) -> float:
+        """估算第q(0~100)分位数"""
+        if not self.count:
+            return 0.0
+        rank = max(math.ceil(q / 100 * self.count), 1)
+        acc = 0
+        for idx in sorted(self.buckets):
+            acc += self.buckets[idx]
+            if acc >= rank:
+                return min(max(self._bucket_value(idx), self.min), self.max)
+        return self.max
+
+    def merge(self, other: "LatencyStats") -> "LatencyStats":
+        """将other的统计结果合并到当前对象"""
+        if (self.precision, self.min_value) != (other.precision, other.min_value):
+            raise ValueError("can not merge LatencyStats with different precision or min_value")
+        with self._lock:
+            count = self.count + other.count
+            if count:
+                delta = other.mean - self.mean
+                self.mean += delta * other.count / count
+                self._m2 += other._m2 + delta**2 * self.count * other.count / count
+            self.count = count
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+            self.buckets.update(other.buckets)
+            self.errors.update(other.errors)
+        return self
+
+    def to_dict(self, with_histogram=False) -> dict:
+        rs = dict(
+            count=self.count,
+            error_num=self.error_num,
+            min=self.min if self.count else 0.0,
+            max=self.max if self.count else 0.0,
+            mean=self.mean,
+            std=self.std,
+        )
+        for q in self.PERCENTILES:
+            rs[f"p{str(q).replace('.', '')}"] = self.percentile(q)
+        rs.update(errors=dict(self.errors))
+        if with_histogram:
+            rs.update(
+                histogram=dict(precision=self.precision, min_value=self.min_value, m2=self._m2, buckets=dict(self.buckets)),
+            )
+        return rs
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "LatencyStats":
+        """从to_dict(with_histogram=True)的结果恢复"""
+        histogram = d["histogram"]
+        stats = cls(precision=histogram["precision"], min_value=histogram["min_value"])
+        stats.count = d["count"]
+        stats.mean = d["mean"]
+        stats._m2 = histogram["m2"]
+        if stats.count:
+            stats.min, stats.max = d["min"], d["max"]
+        stats.buckets.update({int(k): v for k, v in histogram["buckets"].items()})
+        stats.errors.update(d["errors"])
+        return stats
+
+
+# 默认输出到输入文件同名目录下，以当前时间命名
+def _get_output_path(input_path: str, output_path: str, tag: str) -> str:
     name, _ = os.path.splitext(input_path)
     if not output_path:
-        output_path = os.path.join(name, f"{get_current_time_str()}.pef{work_num}.jsonl")
+        output_path = os.path.join(name, f"{get_current_time_str()}.{tag}.jsonl")
     create_dir_path(output_path)
+    return output_path
 
-    queries = read2list(input_path)
+
+class PerfRecorder:
+    """记录压测结果。每个结果完成后实时写入jsonl文件，每隔log_interval秒输出一次区间内的QPS、错误率以及分位数，
+    结束时写入一条{"summary": stat}的汇总记录。keep_results为False时内存占用与测试时长无关
+
+    Args:
+        output_path (str): jsonl结果文件路径
+        log_interval (float, optional): 输出区间统计的间隔(秒)，None表示不输出. Defaults to 10.
+        keep_results (bool, optional): 是否在内存中保留所有结果. Defaults to True.
+        flush_interval (float, optional): 每隔flush_interval秒将缓存的结果写入文件，进程异常退出时最多丢失这段时间的结果，
+            None表示只在攒够一批时写入. Defaults to 1.
+    """
+
+    def __init__(self, output_path: str, log_interval: float = 10, keep_results=True, flush_interval: float = 1):
+        self.output_path = output_path
+        self.log_interval = log_interval
+        self.flush_interval = flush_interval
+        self.results = [] if keep_results else None
+        self.stats = LatencyStats()
+        self.interval_stats = LatencyStats()
+        self._writer = JsonlWriter(output_path, buffer_size=100, background=True)
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._st = self._interval_st = time.perf_counter()
+        self._log_thread = None
+        intervals = [e for e in [log_interval, flush_interval] if e]
+        if intervals:
+            self._tick = min(intervals)
+            self._log_thread = threading.Thread(target=self._run_periodically, name="PerfRecorder", daemon=True)
+            self._log_thread.start()
+
+    def record(self, rs: dict, latency: float):
+        with self._lock:
+            self.stats.record(latency)
+            self.interval_stats.record(latency)
+            self._writer.write(rs)
+            if self.results is not None:
+                self.results.append(rs)
+
+    def record_error(self, item, error: Exception):
+        with self._lock:
+            self.stats.record_error(error)
+            self.interval_stats.record_error(error)
+            self._writer.write(dict(item=item, error=type(error).__name__, error_msg=str(error)))
+
+    def log_interval_stats(self):
+        with self._lock:
+            interval_stats, self.interval_stats = self.interval_stats, LatencyStats()
+            now = time.perf_counter()
+            cost, self._interval_st = now - self._interval_st, now
+        total = interval_stats.count + interval_stats.error_num
+        error_rate = interval_stats.error_num / total if total else 0.0
+        logger.info(
+            f"[{now - self._st:.1f}s] qps:{total / cost:.2f}, error_rate:{error_rate:.4f}, "
+            f"p50:{interval_stats.percentile(50):.4f}, p90:{interval_stats.percentile(90):.4f}, p99:{interval_stats.percentile(99):.4f}"
+        )
+
+    def _run_periodically(self):
+        while not self._stop_event.wait(self._tick):
+            if self.flush_interval:
+                try:
+                    with self._lock:
+                        self._writer.flush()
+                except Exception as e:
+                    logger.warning(f"flush results to {self.output_path} failed with {type(e).__name__}: {e}")
+            if self.log_interval and time.perf_counter() - self._interval_st >= self.log_interval:
+                self.log_interval_stats()
+
+    def close(self, stat: dict):
+        """停止区间统计，写入汇总记录并关闭文件"""
+        self._stop_event.set()
+        if self._log_thread is not None:
+            self._log_thread.join()
+        with self._lock:
+            self._writer.write(dict(summary=stat))
+            self._writer.close()
+        logger.info(f"results dumped to {self.output_path}")
+
+
+def perf_test(input_path, url, req_func, output_path=None, work_num=1, max_num=None, log_interval=10, keep_results=True):
+    """闭环压测，work_num个线程各自在上一个请求返回后发送下一个请求。
+    结果实时写入output_path，最后一行为汇总统计
+
+    Args:
+        input_path (str): 请求数据文件
+        url (str): 服务地址
+        req_func (Callable): 发送请求的函数，返回包含cost的dict
+        output_path (str, optional): 结果输出路径，默认在输入文件同名目录下. Defaults to None.
+        work_num (int, optional): 并发线程数. Defaults to 1.
+        max_num (int, optional): 最多请求数. Defaults to None.
+        log_interval (float, optional): 输出区间统计的间隔(秒). Defaults to 10.
+        keep_results (bool, optional): 是否返回所有结果，长时间测试时设为False以保持内存占用恒定. Defaults to True.
+
+    Returns:
+        tuple[list | None, dict]: 结果list(keep_results为False时为None)以及统计信息
+    """
+    logger.info("perf starts")
+    logger.info(f"input_path: {input_path}, url:{url}, work_num:{work_num}")
+    output_path = _get_output_path(input_path, output_path, tag=f"pef{work_num}")
+    recorder = PerfRecorder(output_path, log_interval=log_interval, keep_results=keep_results)
+
+    def _req_func(item, **kwargs):
+        try:
+            rs = req_func(item, **kwargs)
+        except Exception as e:
+            recorder.record_error(item, e)
+            raise e
+        recorder.record(rs, rs["cost"])
+
+    queries = iter_read2list(input_path, max_data_num=max_num)
     st = time.time()
-    if max_num:
-        queries = queries[:max_num]
+    completed = False
+    try:
+        func = batch_process(work_num=work_num, return_list=False)(_req_func)
+        for _ in func(data=queries, url=url):
+            pass
+        completed = True
+    finally:
+        # 异常或者中断(Ctrl-C)时也写入已收集结果的汇总，并关闭文件
+        cost = time.time() - st
+        latency_stats = recorder.stats
+        test_num = latency_stats.count + latency_stats.error_num
+        stat = dict(
+            test_cost=cost, latency=latency_stats.mean, test_num=test_num, qps=test_num / cost if cost else 0.0, completed=completed
+        )
+        stat.update(latency_stats.to_dict(with_histogram=True))
+        recorder.close(stat)
+    logger.info(f"done")
+    return recorder.results, stat
+
+
+def ramp_profile(start_rate: float, end_rate: float, duration: float, step_num: int = 10) -> list[tuple[float, float]]:
+    """生成从start_rate线性增长到end_rate的阶梯式到达率，返回[(持续秒数, 每秒请求数)]"""
+    step_duration = duration / step_num
+    if step_num == 1:
+        return [(step_duration, start_rate)]
+    return [(step_duration, start_rate + (end_rate - start_rate) * i / (step_num - 1)) for i in range(step_num)]
+
 
-    func = batch_process(work_num=work_num, return_list=True)(req_func)
-    rs = func(data=queries, url=url)
-    # logger.info(rs)
-    cost = time.time() - st
-    costs = [e["cost"] for e in rs]
-    latency = sum(costs) / len(costs)
+def iter_send_times(rate: float | list[tuple[float, float]], arrival="constant", duration=None, max_num=None) -> Iterator[float]:
+    """按照到达率生成每个请求相对于测试开始时间的计划发送时间(秒)
 
-    stat = dict(test_cost=cost, latency=latency, test_num=len(queries), qps=len(queries) / cost)
-    # rs.append(stat)
+    Args:
+        rate (float | list[tuple[float, float]]): 每秒请求数，或者[(持续秒数, 每秒请求数)]形式的阶梯式profile，profile结束后停止
+        arrival (str, optional): constant: 等间隔到达; poisson: 间隔服从指数分布. Defaults to "constant".
+        duration (float, optional): 最长持续时间(秒). Defaults to None.
+        max_num (int, optional): 最多请求数. Defaults to None.
+    """
+    if arrival not in ["constant", "poisson"]:
+        raise ValueError(f"unknown arrival: {arrival}, should be one of constant/poisson")
+    if isinstance(rate, int | float):
+        if not duration and not max_num:
+            raise ValueError("duration or max_num is required for constant rate")
+        steps = [(duration if duration else math.inf, rate)]
+    else:
+        steps = rate
+    num, step_start = 0, 0.0
+    for step_duration, step_rate in steps:
+        step_end = step_start + step_duration
+        if duration:
+            step_end = min(step_end, duration)
+        # 每个阶梯从阶梯开始时间重新计时，constant模式下用下标计算发送时间，避免浮点误差累积
+        t, step_num = step_start, 0
+        while step_rate > 0:
+            if t >= step_end or (max_num and num >= max_num):
+                break
+            yield t
+            num += 1
+            step_num += 1
+            t = t + random.expovariate(step_rate) if arrival == "poisson" else step_start + step_num / step_rate
+        step_start = step_end
+        if (duration and step_start >= duration) or (max_num and num >= max_num):
+            return
+
+
+def open_loop_perf_test(
+    input_path,
+    url,
+    req_func,
+    rate: float | list[tuple[float, float]],
+    arrival="constant",
+    duration=None,
+    max_num=None,
+    output_path=None,
+    work_num=100,
+    log_interval=10,
+    keep_results=True,
+):
+    """开环压测，按照给定的到达率发送请求，不等待前一个请求返回，可以避免coordinated omission问题。
+    latency从计划发送时间开始计算，包含了服务处理不过来时的排队时间
+
+    Args:
+        input_path (str): 请求数据文件，数据不够时循环使用
+        url (str): 服务地址
+        req_func (Callable): 发送请求的函数，返回包含cost的dict，同perf_test
+        rate (float | list[tuple[float, float]]): 每秒请求数，或者阶梯式的profile，见iter_send_times以及ramp_profile
+        arrival (str, optional): constant或者poisson. Defaults to "constant".
+        duration (float, optional): 最长持续时间(秒). Defaults to None.
+        max_num (int, optional): 最多请求数. Defaults to None.
+        output_path (str, optional): 结果输出路径. Defaults to None.
+        work_num (int, optional): 发送请求的最大线程数，需要大于rate*latency，否则请求会在本地排队. Defaults to 100.
+        log_interval (float, optional): 输出区间统计的间隔(秒). Defaults to 10.
+        keep_results (bool, optional): 是否返回所有结果. Defaults to True.
+    """
+    logger.info("open loop perf starts")
+    logger.info(f"input_path: {input_path}, url:{url}, rate:{rate}, arrival:{arrival}, duration:{duration}, max_num:{max_num}")
+    output_path = _get_output_path(input_path, output_path, tag=f"open_loop.{arrival}")
+
+    queries = read2list(input_path)
+    recorder = PerfRecorder(output_path, log_interval=log_interval, keep_results=keep_results)
+    service_stats = LatencyStats()
 
-    logger.info(f"dump to {output_path}")
-    jdump(rs, output_path)
+    def _req_func(item, intended_time):
+        try:
+            rs = req_func(item, url=url)
+        except Exception as e:
+            recorder.record_error(item, e)
+            logger.warning(f"request failed with {type(e).__name__}: {e}")
+            return
+        latency = time.perf_counter() - intended_time
+        service_stats.record(rs["cost"])
+        rs.update(latency=latency, send_time=intended_time - st)
+        recorder.record(rs, latency)
+
+    st = time.perf_counter()
+    executor = ThreadPoolExecutor(work_num)
+    completed = False
+    try:
+        for send_time, item in zip(iter_send_times(rate, arrival, duration, max_num), itertools.cycle(queries)):
+            intended_time = st + send_time
+            wait_time = intended_time - time.perf_counter()
+            if wait_time > 0:
+                time.sleep(wait_time)
+            executor.submit(_req_func, item, intended_time)
+        completed = True
+    finally:
+        # 中断时取消还没有开始的请求，等待已经发出的请求返回后写入汇总并关闭文件
+        executor.shutdown(wait=True, cancel_futures=not completed)
+        cost = time.perf_counter() - st
+        latency_stats = recorder.stats
+        test_num = latency_stats.count + latency_stats.error_num
+        stat = dict(test_cost=cost, test_num=test_num, qps=test_num / cost if cost else 0.0, completed=completed)
+        stat.update(latency_stats.to_dict(with_histogram=True))
+        stat.update(service=service_stats.to_dict())
+        recorder.close(stat)
     logger.info(f"done")
-    return rs, stat
+    return recorder.results, stat
+
+
+# 读取perf_test的结果文件，返回每个成功请求的latency以及汇总统计
+def load_perf_result(path: str) -> tuple["np.ndarray", dict]:
+    import numpy as np
+
+    latencies, summary = [], dict()
+    for record in iter_read2list(path):
+        if "summary" in record:
+            summary = record["summary"]
+        elif "cost" in record:
+            latencies.append(record.get("latency", record["cost"]))
+    return np.array(latencies, dtype=np.float64), summary
+
+
+# Mann-Whitney U检验的双侧p值，使用带ties修正的正态近似
+def mann_whitney_u(x: "np.ndarray", y: "np.ndarray") -> float:
+    import numpy as np
+
+    n1, n2 = len(x), len(y)
+    if not n1 or not n2:
+        return 1.0
+    values, inverse, counts = np.unique(np.concatenate([x, y]), return_inverse=True, return_counts=True)
+    # 相同值取平均rank
+    avg_ranks = np.cumsum(counts) - (counts - 1) / 2
+    ranks = avg_ranks[inverse]
+    u = ranks[:n1].sum() - n1 * (n1 + 1) / 2
+    n = n1 + n2
+    sigma = math.sqrt(n1 * n2 / 12 * ((n + 1) - (counts**3 - counts).sum() / (n * (n - 1))))
+    if sigma == 0:
+        return 1.0
+    z = (u - n1 * n2 / 2) / sigma
+    return math.erfc(abs(z) / math.sqrt(2))
+
+
+# 计算mean或者pXX分位数，分位数的命名同LatencyStats.to_dict，例如p999表示99.9分位
+def _get_metric(latencies: "np.ndarray", metric: str, axis=None):
+    import numpy as np
+
+    if metric == "mean":
+        return latencies.mean(axis=axis)
+    digits = metric[1:]
+    q = float(digits) if len(digits) <= 2 else float(f"{digits[:2]}.{digits[2:]}")
+    return np.percentile(latencies, q, axis=axis)
+
+
+def compare_perf_results(
+    baseline_path: str,
+    candidate_paths: list[str],
+    metrics=("mean", "p50", "p90", "p99"),
+    threshold=0.05,
+    confidence=0.95,
+    n_boot=1000,
+    max_sample=5000,
+    seed=0,
+) -> list[dict]:
+    """对比多次压测的结果，计算各个latency指标相对baseline的变化以及bootstrap置信区间
+
+    当某个指标的变化超过threshold、置信区间下界大于0并且Mann-Whitney U检验显著时，认为出现了性能回退。
+    QPS只有汇总值，下降超过threshold时认为出现了回退
+
+    Args:
+        baseline_path (str): 作为基准的结果文件
+        candidate_paths (list[str]): 需要对比的结果文件
+        metrics (tuple, optional): 对比的指标，mean或者pXX分位数. Defaults to ("mean", "p50", "p90", "p99").
+        threshold (float, optional): 判定回退的相对变化阈值. Defaults to 0.05.
+        confidence (float, optional): 置信度. Defaults to 0.95.
+        n_boot (int, optional): bootstrap重采样次数. Defaults to 1000.
+        max_sample (int, optional): 每个结果最多采样的latency数，控制bootstrap的开销. Defaults to 5000.
+        seed (int, optional): 随机种子. Defaults to 0.
+
+    Returns:
+        list[dict]: 每个candidate的对比结果
+    """
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    alpha = 1 - confidence
+
+    def sample(latencies):
+        if len(latencies) > max_sample:
+            return rng.choice(latencies, max_sample, replace=False)
+        return latencies
+
+    def bootstrap(latencies, metric):
+        boot = rng.choice(latencies, size=(n_boot, len(latencies)), replace=True)
+        return _get_metric(boot, metric, axis=1)
+
+    base_latencies, base_summary = load_perf_result(baseline_path)
+    if not len(base_latencies):
+        raise ValueError(f"no successful requests in {baseline_path}")
+    base_latencies = sample(base_latencies)
+    base_boots = {metric: bootstrap(base_latencies, metric) for metric in metrics}
+
+    rs = []
+    for path in candidate_paths:
+        latencies, summary = load_perf_result(path)
+        if not len(latencies):
+            raise ValueError(f"no successful requests in {path}")
+        latencies = sample(latencies)
+        p_value = mann_whitney_u(base_latencies, latencies)
+        metric_rs = dict()
+        for metric in metrics:
+            base_value, value = float(_get_metric(base_latencies, metric)), float(_get_metric(latencies, metric))
+            changes = bootstrap(latencies, metric) / base_boots[metric] - 1
+            ci_low, ci_high = np.quantile(changes, [alpha / 2, 1 - alpha / 2])
+            change = value / base_value - 1
+            regression = bool(change > threshold and ci_low > 0 and p_value < alpha)
+            metric_rs[metric] = dict(
+                baseline=base_value, candidate=value, change=change, ci_low=float(ci_low), ci_high=float(ci_high), regression=regression
+            )
+        qps_change = summary["qps"] / base_summary["qps"] - 1 if summary.get("qps") and base_summary.get("qps") else None
+        qps_regression = qps_change is not None and qps_change < -threshold
+        rs.append(
+            dict(
+                path=path,
+                baseline_path=baseline_path,
+                mann_whitney_p=p_value,
+                qps_change=qps_change,
+                qps_regression=qps_regression,
+                metrics=metric_rs,
+                regression=qps_regression or any(e["regression"] for e in metric_rs.values()),
+            )
+        )
+    return rs
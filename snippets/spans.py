@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+"""
+@Time    :   2026/10/18 20:16:02
+@Author  :   agent
+@Description  : 层级的耗时统计，记录嵌套的span，支持按名称聚合以及导出json/chrome trace
+"""
+
+import asyncio
+import collections
+import inspect
+import itertools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+# 当前正在执行的span，contextvars保证不同线程以及asyncio task之间互不干扰
+_current_span: ContextVar["Span | None"] = ContextVar("snippets_current_span", default=None)
+_span_ids = itertools.count(1)
+
+
+class Span:
+    """一次耗时记录，时间单位都是ns
+
+    cpu_ns为当前线程的CPU时间，同一线程上并发的asyncio task会互相计入对方的CPU时间
+    """
+
+    __slots__ = ("name", "span_id", "parent_id", "start_ns", "end_ns", "cpu_ns", "memory", "thread_id", "task_name", "attrs")
+
+    def __init__(self, name: str, parent_id: int = None, attrs: dict = None):
+        self.name = name
+        self.span_id = next(_span_ids)
+        self.parent_id = parent_id
+        self.start_ns = self.end_ns = 0
+        self.cpu_ns = 0
+        self.memory = None
+        self.thread_id = threading.get_ident()
+        self.task_name = _get_task_name()
+        self.attrs = attrs if attrs else dict()
+
+    @property
+    def duration_ns(self) -> int:
+        return self.end_ns - self.start_ns
+
+    def to_dict(self) -> dict:
+        return {k: getattr(self, k) for k in self.__slots__} | dict(duration_ns=self.duration_ns)
+
+
+def _get_task_name() -> str | None:
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        return None
+    return task.get_name() if task else None
+
+
+class Tracer:
+    """收集span并按照名称聚合，线程安全
+
+    Args:
+        max_spans (int, optional): 最多保留的span明细数，超过后丢弃最早的，聚合统计不受影响. Defaults to 100000.
+        trace_memory (bool, optional): 是否用tracemalloc记录每个span执行期间新分配的内存，会明显降低执行速度. Defaults to False.
+    """
+
+    def __init__(self, max_spans: int = 100_000, trace_memory=False):
+        self.max_spans = max_spans
+        self.trace_memory = trace_memory
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.spans = collections.deque(maxlen=self.max_spans)
+            self._stats = dict()
+            self._cpu_totals = collections.Counter()
+            self.start_ns = time.perf_counter_ns()
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        parent = _current_span.get()
+        span = Span(name, parent_id=parent.span_id if parent else None, attrs=attrs)
+        token = _current_span.set(span)
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            memory_st = tracemalloc.get_traced_memory()[0]
+        cpu_st = time.thread_time_ns()
+        span.start_ns = time.perf_counter_ns()
+        try:
+            yield span
+        finally:
+            span.end_ns = time.perf_counter_ns()
+            span.cpu_ns = time.thread_time_ns() - cpu_st
+            if self.trace_memory:
+                span.memory = tracemalloc.get_traced_memory()[0] - memory_st
+            _current_span.reset(token)
+            self.record(span)
+
+    def record(self, span: Span):
+        from snippets.perf import LatencyStats
+
+        with self._lock:
+            self.spans.append(span)
+            stats = self._stats.get(span.name)
+            if stats is None:
+                stats = self._stats[span.name] = LatencyStats()
+            self._cpu_totals[span.name] += span.cpu_ns
+        stats.record(span.duration_ns / 1e9)
+
+    def aggregate(self) -> dict[str, dict]:
+        """按span名称聚合，时间单位为秒"""
+        with self._lock:
+            items = list(self._stats.items())
+            cpu_totals = dict(self._cpu_totals)
+        rs = dict()
+        for name, stats in items:
+            rs[name] = dict(
+                count=stats.count,
+                total=stats.mean * stats.count,
+                cpu_total=cpu_totals.get(name, 0) / 1e9,
+                mean=stats.mean,
+                min=stats.min,
+                max=stats.max,
+                p50=stats.percentile(50),
+                p99=stats.percentile(99),
+            )
+        return dict(sorted(rs.items(), key=lambda x: x[1]["total"], reverse=True))
+
+    def to_json(self, path: str = None) -> dict:
+        """导出聚合结果以及span明细"""
+        with self._lock:
+            spans = [span.to_dict() for span in self.spans]
+        rs = dict(aggregate=self.aggregate(), spans=spans)
+        if path:
+            _dump_json(rs, path)
+        return rs
+
+    def to_chrome_trace(self, path: str = None) -> dict:
+        """导出chrome://tracing或者perfetto可以打开的trace格式"""
+        pid = os.getpid()
+        with self._lock:
+            spans = list(self.spans)
+        events = []
+        for span in spans:
+            args = dict(span.attrs, cpu_ms=span.cpu_ns / 1e6)
+            if span.memory is not None:
+                args.update(memory=span.memory)
+            if span.task_name:
+                args.update(task=span.task_name)
+            events.append(
+                dict(
+                    name=span.name,
+                    cat="span",
+                    ph="X",
+                    ts=(span.start_ns - self.start_ns) / 1e3,
+                    dur=span.duration_ns / 1e3,
+                    pid=pid,
+                    tid=span.thread_id,
+                    args=args,
+                )
+            )
+        rs = dict(traceEvents=events, displayTimeUnit="ms")
+        if path:
+            _dump_json(rs, path)
+        return rs
+
+
+def _dump_json(obj, path: str):
+    dir_path = os.path.dirname(os.path.abspath(path))
+    os.makedirs(dir_path, exist_ok=True)
+    with open(path, mode="w", encoding="utf8") as f:
+        json.dump(obj, f, ensure_ascii=False, default=str)
+
+
+_tracer = Tracer()
+
+
+def get_tracer() -> Tracer:
+    return _tracer
+
+
+def set_tracer(tracer: Tracer) -> Tracer:
+    global _tracer
+    _tracer = tracer
+    return _tracer
+
+
+# 使用全局tracer记录一个span
+def span(name: str, **attrs):
+    return _tracer.span(name, **attrs)
+
+
+# 记录function每次执行的span，支持async function
+def trace_span(name: str = None):
+    def wrapper(func):
+        span_name = name if name else func.__qualname__
+        if inspect.iscoroutinefunction(func):
+
+            @wraps(func)
+            async def wrapped(*args, **kwargs):
+                with _tracer.span(span_name):
+                    return await func(*args, **kwargs)
+
+        else:
+
+            @wraps(func)
+            def wrapped(*args, **kwargs):
+                with _tracer.span(span_name):
+                    return func(*args, **kwargs)
+
+        return wrapped
+
+    return wrapper
@@ -9,26 +9,38 @@
 -------------------------------------------------
 """
 
+import bz2
 import collections
+import contextlib
 import copy
 import glob
+import gzip
+import hashlib
+import itertools
 import json
+import lzma
 import os
 import pickle
+import queue
 import re
 import shutil
 import subprocess
+import sys
+import tempfile
+import threading
 import time
-from collections.abc import Callable, Iterable, Iterator, Sequence
+from array import array
+from collections.abc import Callable, Generator, Iterable, Iterator, Sequence
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
-from typing import Any, _GenericAlias
+from typing import TYPE_CHECKING, Any, _GenericAlias
 
-import numpy as np
-import pandas as pd
-from cachetools import LRUCache, cached
 from loguru import logger
-from pydantic import BaseModel
-from tqdm import tqdm
+
+# numpy、pandas、pydantic、tqdm、cachetools都在用到时才导入，减少import snippets的耗时
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
 
 
 # 创建一个目录
@@ -38,6 +50,39 @@ def create_dir_path(path: str):
         os.makedirs(dir_path)
 
 
+# 支持透明读写的压缩格式，zstd需要额外安装zstandard
+_COMPRESSION_OPENERS = {".gz": gzip.open, ".bz2": bz2.open, ".xz": lzma.open}
+try:
+    import zstandard
+
+    _COMPRESSION_OPENERS[".zst"] = zstandard.open
+except ImportError:
+    pass
+COMPRESSION_SUFFIXES = {".gz", ".bz2", ".xz", ".zst"}
+
+
+# 解析文件的格式后缀以及压缩后缀，例如a.jsonl.gz返回(".jsonl", ".gz")，未压缩时压缩后缀为None
+def split_suffix(path: str) -> tuple[str, str | None]:
+    stem, suffix = os.path.splitext(path)
+    suffix = suffix.lower()
+    if suffix in COMPRESSION_SUFFIXES:
+        return os.path.splitext(stem)[-1].lower(), suffix
+    return suffix, None
+
+
+# 打开一个文件，根据压缩后缀自动选择流式解压/压缩的方式，文本模式下默认utf8编码
+def open_file(path: str, mode="r", encoding="utf8"):
+    _, compression = split_suffix(path)
+    if compression is None:
+        return open(path, mode=mode, encoding=None if "b" in mode else encoding)
+    if compression not in _COMPRESSION_OPENERS:
+        raise ImportError(f"zstandard is required to open {path}, please pip install zstandard")
+    opener = _COMPRESSION_OPENERS[compression]
+    if "b" in mode:
+        return opener(path, mode)
+    return opener(path, mode if "t" in mode else mode + "t", encoding=encoding)
+
+
 # 将一个object encode成json string的方法
 class PythonObjectEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -45,15 +90,18 @@ class PythonObjectEncoder(json.JSONEncoder):
             return str(obj)
         if isinstance(obj, set):
             return list(obj)
-        if isinstance(obj, BaseModel):
+        # pydantic以及numpy的对象存在时，对应的模块一定已经被导入，不需要主动import
+        pydantic = sys.modules.get("pydantic")
+        if pydantic and isinstance(obj, pydantic.BaseModel):
             return obj.model_dump(exclude_none=True, exclude_defaults=True)
         if isinstance(obj, datetime):
             return obj.strftime("%Y-%M-%d %H:%m:%S")
-        if isinstance(obj, np.integer):
+        np = sys.modules.get("numpy")
+        if np and isinstance(obj, np.integer):
             return int(obj)
-        if isinstance(obj, np.floating):
+        if np and isinstance(obj, np.floating):
             return float(obj)
-        if isinstance(obj, np.ndarray):
+        if np and isinstance(obj, np.ndarray):
             return obj.tolist()
         else:
             try:
@@ -71,7 +119,7 @@ def jdumps(obj: Any, encoder=PythonObjectEncoder, ensure_ascii=False, indent=4,
 def jdump(obj: Any, fp, encoder=PythonObjectEncoder):
     if isinstance(fp, str):
         create_dir_path(fp)
-        with open(fp, mode="w", encoding="utf8") as fp:
+        with open_file(fp, mode="w") as fp:
             json.dump(obj, fp, ensure_ascii=False, indent=4, cls=encoder)
     else:
         json.dump(obj, fp, ensure_ascii=False, indent=4, cls=encoder)
@@ -80,22 +128,116 @@ def jdump(obj: Any, fp, encoder=PythonObjectEncoder):
 # 将一个string的列表写入文件，常用于构造schema文件
 def dump_lines(lines: list[str], fp):
     if isinstance(fp, str):
-        fp = open(fp, mode="w", encoding="utf8")
+        fp = open_file(fp, mode="w")
     with fp:
         lines = [str(e) + "\n" for e in lines]
         fp.writelines(lines)
 
 
 # 将$obj转json-line string写入$fp。$fp可以是一个文件路径，也可以是一个open函数打开的对象
-def jdump_lines(obj, fp, mode="w", progbar=False):
-    iter_obj = tqdm(obj) if progbar else obj
-    if isinstance(fp, str):
-        create_dir_path(fp)
-        fp = open(fp, mode=mode, encoding="utf8")
-    with fp:
-        for item in iter_obj:
-            line = json.dumps(item, ensure_ascii=False, cls=PythonObjectEncoder) + "\n"
-            fp.write(line)
+def jdump_lines(obj, fp, mode="w", progbar=False, buffer_size=1000, background=False):
+    iter_obj = obj
+    if progbar:
+        from tqdm import tqdm
+
+        iter_obj = tqdm(obj)
+    with JsonlWriter(fp, mode=mode, buffer_size=buffer_size, background=background) as writer:
+        writer.write_many(iter_obj)
+
+
+class JsonlWriter:
+    """
+    批量写jsonline文件。数据先缓存在内存中，每攒够buffer_size条统一encode，拼接成一个字符串后只调用一次write
+    Args:
+        fp: 文件路径或者open之后的对象
+        mode: 打开文件的模式
+        buffer_size: 每批写入的数据条数
+        background: 是否在后台线程中encode以及写文件，避免生产数据的线程阻塞在磁盘IO上
+        max_pending: 后台模式下最多排队等待写入的批次数，超过后write会阻塞
+    """
+
+    _STOP = object()
+
+    def __init__(self, fp, mode="w", buffer_size=1000, background=False, max_pending=8):
+        if isinstance(fp, str):
+            create_dir_path(fp)
+            fp = open_file(fp, mode=mode)
+        self.fp = fp
+        self.buffer_size = max(buffer_size, 1)
+        self.buffer = []
+        # 复用一个encoder实例，避免json.dumps每次调用都构造encoder
+        self._encode = PythonObjectEncoder(ensure_ascii=False).encode
+        self._error = None
+        self._queue = None
+        self._thread = None
+        if background:
+            self._queue = queue.Queue(maxsize=max_pending)
+            self._thread = threading.Thread(target=self._consume, name="JsonlWriter", daemon=True)
+            self._thread.start()
+
+    def _write_batch(self, batch: list):
+        self.fp.write("".join([self._encode(item) + "\n" for item in batch]))
+
+    def _consume(self):
+        while True:
+            batch = self._queue.get()
+            try:
+                if batch is self._STOP:
+                    return
+                if self._error is None:
+                    self._write_batch(batch)
+            except Exception as e:
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _check_error(self):
+        if self._error is not None:
+            raise self._error
+
+    def write(self, item):
+        self.buffer.append(item)
+        if len(self.buffer) >= self.buffer_size:
+            self._submit()
+
+    def write_many(self, items: Iterable):
+        for item in items:
+            self.write(item)
+
+    def _submit(self):
+        self._check_error()
+        if not self.buffer:
+            return
+        batch, self.buffer = self.buffer, []
+        if self._queue is not None:
+            self._queue.put(batch)
+        else:
+            self._write_batch(batch)
+
+    def flush(self):
+        """将缓存的数据全部写入文件"""
+        self._submit()
+        if self._queue is not None:
+            self._queue.join()
+            self._check_error()
+        self.fp.flush()
+
+    def close(self):
+        try:
+            self._submit()
+            if self._thread is not None:
+                self._queue.put(self._STOP)
+                self._thread.join()
+                self._thread = None
+            self._check_error()
+        finally:
+            self.fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
 
 
 # 将json string load成python object
@@ -108,34 +250,99 @@ def as_python_object(dct):
     return dct
 
 
+# 可选的更快的json解析后端，优先orjson，其次ujson，都没有安装时使用标准库json
+try:
+    import orjson as _fast_json
+except ImportError:
+    try:
+        import ujson as _fast_json
+    except ImportError:
+        _fast_json = json
+
+_PYTHON_OBJECT_MARKER = "_python_object"
+
+
 # 将$fp的内容load成一个json对象。$fp可以是一个文件路径，也可以是一个open函数打开的对象
-def jload(fp):
+def jload(fp, fast=True):
     if isinstance(fp, str):
-        fp = open(fp, encoding="utf8")
+        fp = open_file(fp)
     with fp as fp:
-        rs = json.load(fp, object_hook=as_python_object)
+        rs = jloads(fp.read(), fast=fast)
     return rs
 
 
 # 将$s的内容load成一个json对象。
-def jloads(s: str):
+def jloads(s: str | bytes, fast=True):
+    """
+    将json string load成python object
+    Args:
+        s: json string，也可以是utf8编码的bytes(例如"rb"模式打开的文件内容)
+        fast: 为True时，只有s中包含_python_object标记才使用as_python_object做object_hook，否则直接用更快的后端解析
+    """
+    marker = _PYTHON_OBJECT_MARKER.encode("utf8") if isinstance(s, bytes | bytearray) else _PYTHON_OBJECT_MARKER
+    if fast and marker not in s:
+        try:
+            return _fast_json.loads(s)
+        except ValueError:
+            # orjson/ujson不支持NaN、超长整数等标准库可以解析的内容，回退到标准库
+            pass
     return json.loads(s, object_hook=as_python_object)
 
 
+# 将jsonline文件切分成按行对齐的字节区间[start, end)
+def _get_line_aligned_ranges(path: str, chunk_num: int) -> list[tuple[int, int]]:
+    file_size = os.path.getsize(path)
+    if file_size == 0:
+        return []
+    chunk_size = max(file_size // chunk_num, 1)
+    ranges = []
+    with open(path, mode="rb") as f:
+        start = 0
+        while start < file_size:
+            end = start + chunk_size
+            if end >= file_size:
+                end = file_size
+            else:
+                f.seek(end)
+                f.readline()
+                end = f.tell()
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+# 解析jsonline文件中[start, end)字节区间内的所有行，需要定义在模块级别以便多进程pickle
+def _jload_range(path: str, start: int, end: int, max_data_num=None) -> list:
+    rs = []
+    with open(path, mode="rb") as f:
+        f.seek(start)
+        # 只按\n切分，str.splitlines()还会在\x85、\u2028等json中允许出现的未转义字符处切分
+        for line in f.read(end - start).split(b"\n"):
+            line = line.decode("utf8").strip()
+            if not line:
+                continue
+            rs.append(jloads(line))
+            if max_data_num and len(rs) >= max_data_num:
+                break
+    return rs
+
+
 # get a generator with from a jsonline file
-def jload_lines(fp, max_data_num=None, return_generator=False):
+def jload_lines(fp, max_data_num=None, return_generator=False, work_num=None, chunk_num=None):
     """
     将jsonline格式的文件转化成json object的generator。适用于文件过大，不想全部load到内存的时候
     Args:
         fp: 文件路径或者open之后的对象
         max_data_num: 最大load的数据条目数
         return_generator: 是否返回generator
+        work_num: 并行解析的进程数，大于1且fp为未压缩的文件路径时，将文件切分成按行对齐的字节区间，用进程池并行解析，结果保持原文件顺序
+        chunk_num: 并行解析时切分的区间数，默认为work_num的4倍
     Returns: json object的generator
     """
 
     def get_gen(f):
         if isinstance(f, str):
-            f = open(f, encoding="utf8")
+            f = open_file(f)
         idx = 0
         with f as f:
             for line in f:
@@ -147,78 +354,302 @@ def jload_lines(fp, max_data_num=None, return_generator=False):
                 if max_data_num and idx >= max_data_num:
                     break
 
-    gen = get_gen(fp)
+    def get_parallel_gen(path):
+        ranges = iter(_get_line_aligned_ranges(path, chunk_num or work_num * 4))
+        idx = 0
+        with ProcessPoolExecutor(work_num) as executor:
+            # 最多同时提交2*work_num个区间，按提交顺序取结果以保证行序，同时避免所有区间的结果堆积在内存中
+            futures = collections.deque()
+            try:
+                while True:
+                    while len(futures) < work_num * 2:
+                        r = next(ranges, None)
+                        if r is None:
+                            break
+                        futures.append(executor.submit(_jload_range, path, *r, max_data_num))
+                    if not futures:
+                        return
+                    for item in futures.popleft().result():
+                        yield item
+                        idx += 1
+                        if max_data_num and idx >= max_data_num:
+                            return
+            finally:
+                for future in futures:
+                    future.cancel()
+
+    if work_num and work_num > 1 and isinstance(fp, str) and split_suffix(fp)[1] is None:
+        gen = get_parallel_gen(fp)
+    else:
+        gen = get_gen(fp)
     if return_generator:
         return gen
     return list(gen)
 
 
-# table类的文件转化为list of dict
+class JsonlIndex:
+    """
+    jsonline文件的行偏移量索引，支持随机访问第i条数据或者一个区间的数据，不需要从头读取整个文件。
+    索引以.npy格式存储在旁边的{path}.idx.npy文件中，使用内存映射读取。
+    文件的大小或者修改时间变化后，重新创建JsonlIndex时索引会自动重建。
+    """
 
+    # 索引头部存储文件大小以及修改时间(ns)，用于判断索引是否失效
+    HEADER_LEN = 2
+    # 建索引时每攒够这么多个偏移量写一次磁盘
+    BUILD_CHUNK_SIZE = 1 << 20
 
-def table2json(path, **kwargs):
-    if path.endswith("csv"):
-        df = pd.read_csv(path, **kwargs)
-    if path.endswith("xlsx"):
-        df = pd.read_excel(path, **kwargs)
-    df.replace(np.nan, None, inplace=True)
+    def __init__(self, path: str, index_path: str = None):
+        if split_suffix(path)[1] is not None:
+            raise ValueError(f"random access is not supported for compressed file: {path}")
+        self.path = path
+        self.index_path = index_path if index_path else f"{path}.idx.npy"
+        self._offsets = self._load_or_build()
+
+    def _file_meta(self) -> tuple[int, int]:
+        stat = os.stat(self.path)
+        return stat.st_size, stat.st_mtime_ns
+
+    def _load_or_build(self) -> "np.ndarray":
+        import numpy as np
+
+        file_size, mtime_ns = self._file_meta()
+        if os.path.exists(self.index_path):
+            try:
+                index = np.load(self.index_path, mmap_mode="r")
+                if len(index) >= self.HEADER_LEN and (int(index[0]), int(index[1])) == (file_size, mtime_ns):
+                    self.file_size = file_size
+                    return index[self.HEADER_LEN :]
+            except (OSError, ValueError):
+                pass
+            logger.debug(f"index:{self.index_path} is stale, rebuilding")
+        return self.build()
+
+    def build(self) -> "np.ndarray":
+        """扫描一遍文件，记录每个非空行的起始偏移量，写入索引文件。偏移量分块落盘，内存占用与文件行数无关"""
+        import numpy as np
+
+        file_size, mtime_ns = self._file_meta()
+        create_dir_path(self.index_path)
+        # 先写临时文件再rename，避免并发读取到写了一半的索引
+        raw_path = f"{self.index_path}.{os.getpid()}.tmp.raw"
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp.npy"
+        try:
+            num = 0
+            with open(self.path, mode="rb") as f, open(raw_path, mode="wb") as raw_file:
+                buffer = array("Q", [file_size, mtime_ns])
+                offset = 0
+                for line in f:
+                    # 只索引建索引时文件大小以内的部分，与头部记录的文件大小保持一致
+                    if offset >= file_size:
+                        break
+                    if line.strip():
+                        buffer.append(offset)
+                        if len(buffer) >= self.BUILD_CHUNK_SIZE:
+                            buffer.tofile(raw_file)
+                            num += len(buffer)
+                            buffer = array("Q")
+                    offset += len(line)
+                buffer.tofile(raw_file)
+                num += len(buffer)
+            # 行数确定后再生成.npy文件，分块从临时文件拷贝
+            raw = np.memmap(raw_path, dtype=np.uint64, mode="r", shape=(num,))
+            index = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.uint64, shape=(num,))
+            for start in range(0, num, self.BUILD_CHUNK_SIZE):
+                index[start : start + self.BUILD_CHUNK_SIZE] = raw[start : start + self.BUILD_CHUNK_SIZE]
+            index.flush()
+            del raw, index
+            os.replace(tmp_path, self.index_path)
+        finally:
+            for path in [raw_path, tmp_path]:
+                if os.path.exists(path):
+                    os.remove(path)
+        self.file_size = file_size
+        return np.load(self.index_path, mmap_mode="r")[self.HEADER_LEN :]
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def _read_range(self, start: int, end: int) -> list:
+        if start >= end:
+            return []
+        begin = int(self._offsets[start])
+        # 读到建索引时的文件大小为止，索引建好之后追加的内容不在索引范围内
+        stop = int(self._offsets[end]) if end < len(self) else self.file_size
+        with open(self.path, mode="rb") as f:
+            f.seek(begin)
+            content = f.read(stop - begin)
+        # 只按\n切分，与建索引以及get保持一致
+        return [jloads(line.decode("utf8")) for line in content.split(b"\n") if line.strip()]
+
+    def get(self, i: int):
+        """获取第i条数据，支持负数下标"""
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(f"index {i} out of range for {self.path} with {len(self)} lines")
+        with open(self.path, mode="rb") as f:
+            f.seek(int(self._offsets[i]))
+            return jloads(f.readline().decode("utf8"))
+
+    def slice(self, start: int = None, end: int = None) -> list:
+        """获取[start, end)区间的数据，语义同list切片"""
+        start, end, _ = slice(start, end).indices(len(self))
+        return self._read_range(start, end)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            if item.step not in (None, 1):
+                return [self.get(i) for i in range(*item.indices(len(self)))]
+            return self.slice(item.start, item.stop)
+        return self.get(item)
+
+
+# table类文件的后缀名
+TABLE_SUFFIXES = [".xlsx", ".csv", ".parquet", ".feather", ".arrow"]
+
+
+# 将DataFrame转化成orient指定的格式
+def _convert_table(df: "pd.DataFrame", orient: str):
     cols = [e for e in df.columns if not str(e).startswith("Unnamed")]
     df = df[cols]
-    records = df.to_dict(orient="records")
-    return records
+    if orient == "dataframe":
+        return df
+    if orient == "columns":
+        return {col: df[col].to_numpy() for col in df.columns}
+    if orient == "records":
+        df = df.replace(float("nan"), None)
+        return df.to_dict(orient="records")
+    raise ValueError(f"unknown orient: {orient}, should be one of records/dataframe/columns")
+
+
+# table类的文件转化为list of dict
+
+
+def table2json(path, orient="records", chunksize=None, **kwargs):
+    """
+    读取table类的文件
+    Args:
+        path: 文件路径，支持csv/xlsx/parquet/feather/arrow
+        orient: 返回格式。records: list of dict; dataframe: pd.DataFrame; columns: 列名到numpy数组的dict
+        chunksize: 仅对csv有效，分块读取，返回generator。records格式逐条返回，其他格式每块返回一个结果
+    """
+    import pandas as pd
+
+    suffix, compression = split_suffix(path)
+
+    def read_binary(read_func):
+        if compression is None:
+            return read_func(path, **kwargs)
+        with open_file(path, mode="rb") as f:
+            return read_func(f, **kwargs)
+
+    if suffix == ".csv":
+        if chunksize:
+            return _iter_csv_chunks(path, orient, chunksize, **kwargs)
+        # pandas会根据后缀自动流式解压
+        df = pd.read_csv(path, **kwargs)
+    elif suffix == ".xlsx":
+        df = read_binary(pd.read_excel)
+    elif suffix == ".parquet":
+        df = read_binary(pd.read_parquet)
+    elif suffix in [".feather", ".arrow"]:
+        df = read_binary(pd.read_feather)
+    else:
+        raise ValueError(f"Unknown table format: {path}")
+    return _convert_table(df, orient)
+
+
+# 分块读取csv文件
+def _iter_csv_chunks(path, orient, chunksize, **kwargs):
+    import pandas as pd
+
+    with pd.read_csv(path, chunksize=chunksize, **kwargs) as reader:
+        for df in reader:
+            rs = _convert_table(df, orient)
+            if orient == "records":
+                yield from rs
+            else:
+                yield rs
 
 
 # 将list数据存储成table格式
 def dump2table(data, path: str):
+    import pandas as pd
+
     if isinstance(data, list):
         data = pd.DataFrame.from_records(data)
+    if isinstance(data, dict):
+        data = pd.DataFrame(data)
     assert isinstance(data, pd.DataFrame)
     df = data
-    if path.endswith(".csv"):
+    suffix, compression = split_suffix(path)
+
+    def write_binary(write_func):
+        if compression is None:
+            return write_func(path)
+        with open_file(path, mode="wb") as f:
+            return write_func(f)
+
+    if suffix == ".csv":
         df.to_csv(path, index=False)
-    elif path.endswith(".xlsx"):
-        df.to_excel(path, index=False)
+    elif suffix == ".xlsx":
+        write_binary(lambda f: df.to_excel(f, index=False))
+    elif suffix == ".parquet":
+        write_binary(lambda f: df.to_parquet(f, index=False))
+    elif suffix in [".feather", ".arrow"]:
+        write_binary(df.to_feather)
     else:
         raise Exception(f"Unknown file format: {path}")
 
 
 # 一行一行地读取文件内容
 def load_lines(fp, return_generator=False):
-    if isinstance(fp, str):
-        fp = open(fp, encoding="utf8")
-    with fp:
-        lines = fp.readlines()
-        if return_generator:
-            return (e.strip() for e in lines if e)
-        return [e.strip() for e in lines if e]
+    def get_gen(f):
+        if isinstance(f, str):
+            f = open_file(f)
+        with f:
+            for line in f:
+                yield line.strip()
 
+    gen = get_gen(fp)
+    if return_generator:
+        return gen
+    return list(gen)
 
-# 根据后缀名读取list数据
 
+# 根据后缀名读取一个文件
+def _read_file(file_path: str, **kwargs):
+    suffix, _ = split_suffix(file_path)
+    if suffix == ".json":
+        return jload(file_path, **kwargs)
+    if suffix == ".jsonl":
+        return jload_lines(file_path, **kwargs)
+    if suffix in TABLE_SUFFIXES:
+        return table2json(file_path, **kwargs)
+    if suffix in [".txt"]:
+        return load_lines(file_path, **kwargs)
+    else:
+        logger.warning(f"unknown suffix:{suffix}, read as txt")
+        return load_lines(file_path, **kwargs)
 
-def read2list(file_path: str | list, **kwargs) -> list[str | dict]:
-    def _read2list(file_path, **kwargs):
-        suffix = os.path.splitext(file_path)[-1].lower()
-        if suffix == ".json":
-            return jload(file_path, **kwargs)
-        if suffix == ".jsonl":
-            return jload_lines(file_path, **kwargs)
-        if suffix in [".xlsx", ".csv"]:
-            return table2json(file_path, **kwargs)
-        if suffix in [".txt"]:
-            return load_lines(file_path, **kwargs)
-        else:
-            logger.warning(f"unknown suffix:{suffix}, read as txt")
-            return load_lines(file_path, **kwargs)
 
+# 展开文件路径中的通配符
+def _expand_file_paths(file_path: str | list) -> list[str]:
     if isinstance(file_path, str):
-        file_path = glob.glob(file_path) if "*" in file_path else [file_path]
+        return glob.glob(file_path) if "*" in file_path else [file_path]
+    return file_path
+
+
+# 根据后缀名读取list数据
+
 
+def read2list(file_path: str | list, **kwargs) -> list[str | dict]:
     rs = []
-    for f in file_path:
+    for f in _expand_file_paths(file_path):
         # logger.info(f"reading file_path={f}")
-        tmp = _read2list(f, **kwargs)
-        if isinstance(tmp, list):
+        tmp = _read_file(f, **kwargs)
+        if isinstance(tmp, list | Generator):
             rs.extend(tmp)
         else:
             rs.append(tmp)
@@ -226,15 +657,82 @@ def read2list(file_path: str | list, **kwargs) -> list[str | dict]:
     return rs
 
 
+def iter_read2list(file_path: str | list, max_data_num=None, prefetch_num=0, **kwargs) -> Iterator[str | dict]:
+    """
+    逐个文件流式读取数据，适用于通配符匹配到大量文件，不想全部load到内存的时候
+    Args:
+        file_path: 文件路径、带*的通配符或者文件路径列表
+        max_data_num: 全局最大读取的数据条目数，达到后不再打开新的文件
+        prefetch_num: 大于0时，用prefetch_num个线程提前读取后续的文件，最多缓存prefetch_num个文件的数据
+        **kwargs: 透传给各个格式的读取函数
+    Returns: 数据的generator
+    """
+    file_paths = _expand_file_paths(file_path)
+
+    def read_one(path: str, streaming: bool):
+        suffix, _ = split_suffix(path)
+        if suffix == ".jsonl":
+            return jload_lines(path, max_data_num=max_data_num, return_generator=streaming, **kwargs)
+        if suffix != ".json" and suffix not in TABLE_SUFFIXES:
+            return load_lines(path, return_generator=streaming, **kwargs)
+        rs = _read_file(path, **kwargs)
+        return rs if isinstance(rs, list | Generator) else [rs]
+
+    def iter_file_items():
+        for path in file_paths:
+            yield read_one(path, streaming=True)
+
+    def iter_prefetched_file_items():
+        paths = iter(file_paths)
+        with ThreadPoolExecutor(prefetch_num) as executor:
+            futures = collections.deque()
+            try:
+                while True:
+                    while len(futures) < prefetch_num and not is_full():
+                        path = next(paths, None)
+                        if path is None:
+                            break
+                        futures.append(executor.submit(read_one, path, False))
+                    if not futures:
+                        return
+                    yield futures.popleft().result()
+            finally:
+                for future in futures:
+                    future.cancel()
+
+    num = 0
+
+    def is_full():
+        return bool(max_data_num) and num >= max_data_num
+
+    file_items_iter = iter_prefetched_file_items() if prefetch_num > 0 else iter_file_items()
+    try:
+        for items in file_items_iter:
+            try:
+                for item in items:
+                    yield item
+                    num += 1
+                    if is_full():
+                        return
+            finally:
+                if isinstance(items, Generator):
+                    items.close()
+    finally:
+        file_items_iter.close()
+
+
+iter_load = iter_read2list
+
+
 # 将list数据按照后缀名格式dump到文件
 def dump2list(data: list, file_path: str, **kwargs):
     create_dir_path(file_path)
-    suffix = os.path.splitext(file_path)[-1].lower()
+    suffix, _ = split_suffix(file_path)
     if suffix == ".json":
         return jdump(data, file_path, **kwargs)
     if suffix == ".jsonl":
         return jdump_lines(data, file_path, **kwargs)
-    if suffix in [".xlsx", ".csv"]:
+    if suffix in TABLE_SUFFIXES:
         return dump2table(data, file_path)
     if suffix in [".txt"]:
         return dump_lines(data, file_path, **kwargs)
@@ -250,18 +748,320 @@ dump = dump2list
 load = read2list
 
 
-@cached(cache=LRUCache(10))
-def _load_with_cache(file_path, last_modified_time, **kwargs):
-    dt_object = datetime.fromtimestamp(last_modified_time)
-    last_modified_time = dt_object.strftime("%Y-%m-%d %H:%M:%S")
-    logger.debug(f"loading file:{file_path} with {last_modified_time=}, {kwargs=}")
-    data = load(file_path, **kwargs)
-    return data
+# 估算python对象在内存中占用的大小(bytes)，容器类对象只采样前sample_num个元素来估算
+def estimate_size(obj, sample_num=64) -> int:
+    pd, np = sys.modules.get("pandas"), sys.modules.get("numpy")
+    if pd and isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(deep=True).sum())
+    if np and isinstance(obj, np.ndarray):
+        return obj.nbytes
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        sample = list(itertools.islice(obj.items(), sample_num))
+        if sample:
+            size += sum(estimate_size(k, sample_num) + estimate_size(v, sample_num) for k, v in sample) * len(obj) // len(sample)
+    elif isinstance(obj, list | tuple | set | frozenset):
+        sample = list(itertools.islice(obj, sample_num))
+        if sample:
+            size += sum(estimate_size(e, sample_num) for e in sample) * len(obj) // len(sample)
+    return size
+
+
+# 创建一个记录淘汰次数的cachetools缓存
+def _make_stat_cache(max_bytes: int, ttl: float, getsizeof: Callable):
+    from cachetools import LRUCache, TTLCache
+
+    class _StatCache(TTLCache if ttl else LRUCache):
+        evictions = 0
+
+        def popitem(self):
+            item = super().popitem()
+            self.evictions += 1
+            return item
 
+    if ttl:
+        return _StatCache(maxsize=max_bytes, ttl=ttl, getsizeof=getsizeof)
+    return _StatCache(maxsize=max_bytes, getsizeof=getsizeof)
 
-def load_with_cache(file_path, **kwargs):
-    last_modified_time = os.path.getmtime(file_path)
-    return _load_with_cache(file_path, last_modified_time, **kwargs)
+
+class LoadCache:
+    """
+    线程安全的数据加载缓存，按照估算的内存大小(bytes)而非条目数限制容量
+    Args:
+        max_bytes: 内存中缓存数据的总大小上限
+        ttl: 每个条目的过期时间(秒)，None表示不过期
+        cache_dir: 可选的磁盘二级缓存目录，数据以pickle格式存储，进程重启后不需要重新解析原始文件
+        getsizeof: 估算数据大小的函数
+    """
+
+    def __init__(self, max_bytes: int = 1 << 30, ttl: float = None, cache_dir: str = None, getsizeof: Callable = estimate_size):
+        self._cache = _make_stat_cache(max_bytes, ttl, getsizeof)
+        self.cache_dir = cache_dir
+        self._lock = threading.RLock()
+        # 同一个key同时只允许一个线程加载，避免并发重复解析同一个大文件
+        self._key_locks = collections.defaultdict(threading.Lock)
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+
+    def _disk_path(self, key) -> str:
+        digest = hashlib.sha1(repr(key).encode("utf8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}.pkl")
+
+    def _load_from_disk(self, key):
+        path = self._disk_path(key)
+        if not os.path.exists(path):
+            return None
+        with open(path, mode="rb") as f:
+            stored_key, value = pickle.load(f)
+        if stored_key != key:
+            return None
+        return value
+
+    def _dump_to_disk(self, key, value):
+        path = self._disk_path(key)
+        create_dir_path(path)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, mode="wb") as f:
+            pickle.dump((key, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def _get(self, key):
+        with self._lock:
+            try:
+                value = self._cache[key]
+                self.hits += 1
+                return True, value
+            except KeyError:
+                return False, None
+
+    def get_or_load(self, key, load_func: Callable):
+        """从缓存获取key对应的数据，不存在时先查询磁盘缓存，再调用load_func加载"""
+        found, value = self._get(key)
+        if found:
+            return value
+        with self._lock:
+            key_lock = self._key_locks[key]
+        with key_lock:
+            found, value = self._get(key)
+            if found:
+                return value
+            with self._lock:
+                self.misses += 1
+            value = self._load_from_disk(key) if self.cache_dir else None
+            if value is not None:
+                self.disk_hits += 1
+            else:
+                value = load_func()
+                if self.cache_dir:
+                    self._dump_to_disk(key, value)
+            with self._lock:
+                try:
+                    self._cache[key] = value
+                except ValueError:
+                    logger.debug(f"value of {key} is larger than max_bytes:{self._cache.maxsize}, skip memory cache")
+                self._key_locks.pop(key, None)
+        return value
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(
+                hits=self.hits,
+                misses=self.misses,
+                disk_hits=self.disk_hits,
+                evictions=self._cache.evictions,
+                size=len(self._cache),
+                current_bytes=self._cache.currsize,
+                max_bytes=self._cache.maxsize,
+            )
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+
+_load_cache = None
+
+
+# 设置load_with_cache默认使用的缓存
+def set_load_cache(**kwargs) -> LoadCache:
+    global _load_cache
+    _load_cache = LoadCache(**kwargs)
+    return _load_cache
+
+
+def get_load_cache() -> LoadCache:
+    global _load_cache
+    if _load_cache is None:
+        _load_cache = LoadCache()
+    return _load_cache
+
+
+def load_with_cache(file_path, cache: LoadCache = None, **kwargs):
+    """
+    带缓存的load，缓存key由文件路径、修改时间、文件大小以及kwargs组成，文件变化后自动重新加载
+    Args:
+        file_path: 文件路径
+        cache: 使用的缓存，默认使用set_load_cache设置的全局缓存
+        **kwargs: 透传给load的参数，需要是hashable的
+    """
+    cache = cache if cache else get_load_cache()
+    stat = os.stat(file_path)
+    key = (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size, tuple(sorted(kwargs.items())))
+
+    def load_func():
+        last_modified_time = datetime.fromtimestamp(stat.st_mtime).strftime("%Y-%m-%d %H:%M:%S")
+        logger.debug(f"loading file:{file_path} with {last_modified_time=}, {kwargs=}")
+        return load(file_path, **kwargs)
+
+    return cache.get_or_load(key, load_func)
+
+
+_WRAPPED_VALUE_COLUMN = "_value"
+# 各行的key不一致时，记录每行缺失的key，还原list时删除这些key，避免多出值为None的key
+_MISSING_KEYS_COLUMN = "_missing_keys"
+# 缓存文件的存储方式记录在schema的metadata中。rows: 每个key一列; values: 非dict数据存放在_value列;
+# json: 每行json序列化后存放在_value列; object: 非list的数据整体json序列化后存放在_value列
+_LAYOUT_METADATA_KEY = b"snippets.layout"
+# 缓存格式变化时修改版本号，使旧的缓存文件失效
+_SHARED_CACHE_VERSION = 2
+
+
+# 跨进程的文件锁，优先使用fcntl.flock，没有fcntl的平台(Windows)用O_CREAT|O_EXCL创建锁文件
+@contextlib.contextmanager
+def _file_lock(lock_path: str, poll_interval=0.05, stale_seconds=600):
+    """释放锁时会删除锁文件，其他进程可能拿到已删除文件上的锁，所以调用方需要在持锁后重新检查条件"""
+    try:
+        import fcntl
+    except ImportError:
+        fcntl = None
+
+    if fcntl is not None:
+        with open(lock_path, mode="w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(lock_path)
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        return
+
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            # 持锁进程异常退出时锁文件不会被删除，超过stale_seconds认为锁已失效
+            with contextlib.suppress(FileNotFoundError):
+                if time.time() - os.path.getmtime(lock_path) > stale_seconds:
+                    os.remove(lock_path)
+                    continue
+            time.sleep(poll_interval)
+    try:
+        yield
+    finally:
+        os.close(fd)
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(lock_path)
+
+
+# 将load的结果转成pyarrow.Table，Arrow无法无损表示的数据逐行json序列化存储
+def _data2arrow_table(data: list):
+    import pyarrow as pa
+
+    if not isinstance(data, list):
+        # 例如json文件load出来的dict，整体序列化成一行
+        schema = pa.schema([(_WRAPPED_VALUE_COLUMN, pa.string())], metadata={_LAYOUT_METADATA_KEY: b"object"})
+        return pa.table({_WRAPPED_VALUE_COLUMN: [jdumps(data, indent=None)]}, schema=schema)
+    try:
+        if data and all(isinstance(e, dict) for e in data):
+            # schema取所有行的key的并集，每一列的类型由该列所有的值推断，而不是只看第一行
+            keys = list(dict.fromkeys(k for row in data for k in row))
+            if _MISSING_KEYS_COLUMN not in keys:
+                columns = {k: pa.array([row.get(k) for row in data]) for k in keys}
+                if any(len(row) < len(keys) for row in data):
+                    missing_keys = [[k for k in keys if k not in row] for row in data]
+                    columns[_MISSING_KEYS_COLUMN] = pa.array(missing_keys, type=pa.list_(pa.string()))
+                schema = pa.schema([(k, column.type) for k, column in columns.items()], metadata={_LAYOUT_METADATA_KEY: b"rows"})
+                table = pa.table(columns, schema=schema)
+                if _arrow_table2list(table) == data:
+                    return table
+        elif data:
+            schema = pa.schema([(_WRAPPED_VALUE_COLUMN, pa.array(data).type)], metadata={_LAYOUT_METADATA_KEY: b"values"})
+            table = pa.table({_WRAPPED_VALUE_COLUMN: data}, schema=schema)
+            if _arrow_table2list(table) == data:
+                return table
+    except (pa.ArrowException, TypeError, ValueError):
+        pass
+    schema = pa.schema([(_WRAPPED_VALUE_COLUMN, pa.string())], metadata={_LAYOUT_METADATA_KEY: b"json"})
+    return pa.table({_WRAPPED_VALUE_COLUMN: [jdumps(e, indent=None) for e in data]}, schema=schema)
+
+
+# 将_data2arrow_table生成的Table还原成load的结果
+def _arrow_table2list(table) -> list:
+    layout = (table.schema.metadata or {}).get(_LAYOUT_METADATA_KEY, b"rows")
+    if layout == b"object":
+        return jloads(table.column(_WRAPPED_VALUE_COLUMN)[0].as_py())
+    if layout == b"json":
+        return [jloads(e) for e in table.column(_WRAPPED_VALUE_COLUMN).to_pylist()]
+    if layout == b"values":
+        return table.column(_WRAPPED_VALUE_COLUMN).to_pylist()
+    if _MISSING_KEYS_COLUMN not in table.column_names:
+        return table.to_pylist()
+    missing_keys = table.column(_MISSING_KEYS_COLUMN).to_pylist()
+    rows = table.drop_columns([_MISSING_KEYS_COLUMN]).to_pylist()
+    for row, keys in zip(rows, missing_keys):
+        for k in keys:
+            del row[k]
+    return rows
+
+
+def load_with_shared_cache(file_path: str, cache_dir: str = None, return_type="table", **kwargs):
+    """
+    跨进程共享的解析缓存。第一个进程解析文件后以Arrow IPC格式写入cache_dir，
+    其他进程直接内存映射该文件，不需要重复解析，多个进程共享同一份物理内存。
+    缓存key由文件路径、修改时间、文件大小以及kwargs组成。需要安装pyarrow
+    dict数据按key的并集存成多列；Arrow无法无损表示的数据(例如同一个key的值类型不一致)逐行json序列化存放在_value列
+    Args:
+        file_path: 文件路径
+        cache_dir: 缓存目录，默认为系统临时目录下的snippets_parse_cache
+        return_type: table: 零拷贝的pyarrow.Table; dataframe: pandas.DataFrame; list: 和load一样的list数据，后两者会拷贝数据
+        **kwargs: 透传给load的参数
+    """
+    try:
+        import pyarrow as pa
+    except ImportError as e:
+        raise ImportError("pyarrow is required for load_with_shared_cache, please pip install pyarrow") from e
+
+    cache_dir = cache_dir if cache_dir else os.path.join(tempfile.gettempdir(), "snippets_parse_cache")
+    os.makedirs(cache_dir, exist_ok=True)
+    stat = os.stat(file_path)
+    key = (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size, tuple(sorted(kwargs.items())), _SHARED_CACHE_VERSION)
+    digest = hashlib.sha1(repr(key).encode("utf8")).hexdigest()
+    cache_path = os.path.join(cache_dir, f"{digest}.arrow")
+
+    if not os.path.exists(cache_path):
+        # 用文件锁保证只有一个进程解析，其他进程等待解析完成后直接映射
+        with _file_lock(f"{cache_path}.lock"):
+            if not os.path.exists(cache_path):
+                logger.debug(f"parsing {file_path} into shared cache:{cache_path}")
+                table = _data2arrow_table(load(file_path, **kwargs))
+                tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+                with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+                os.replace(tmp_path, cache_path)
+
+    table = pa.ipc.open_file(pa.memory_map(cache_path, "r")).read_all()
+    if return_type == "list":
+        return _arrow_table2list(table)
+    if _MISSING_KEYS_COLUMN in table.column_names:
+        table = table.drop_columns([_MISSING_KEYS_COLUMN])
+    if return_type == "table":
+        return table
+    if return_type == "dataframe":
+        return table.to_pandas()
+    raise ValueError(f"unknown return_type: {return_type}, should be one of table/dataframe/list")
 
 
 # 递归将obj中的float做精度截断
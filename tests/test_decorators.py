@@ -9,6 +9,8 @@
 -------------------------------------------------
 """
 
+import itertools
+import os
 import random
 import unittest
 
@@ -29,6 +31,10 @@ def sleep_with_add(a):
     return add(a, sleep=True)
 
 
+def get_pid(_):
+    return os.getpid()
+
+
 class TestUtils(unittest.TestCase):
     def test_adapt_single(self):
         @adapt_single(ele_name="data")
@@ -59,6 +65,74 @@ class TestUtils(unittest.TestCase):
 
         sleep_add(1, 2)
 
+    def test_log_function_info(self):
+        records = []
+        handler_id = logger.add(lambda m: records.append(m.record), level="DEBUG", format="{message}")
+
+        class Payload:
+            str_num = 0
+
+            def __str__(self):
+                Payload.str_num += 1
+                return "x" * 100
+
+            __repr__ = __str__
+
+        try:
+            # TRACE级别未开启时不格式化参数以及返回值
+            @log_function_info(input_level="TRACE", result_level="TRACE")
+            def identity(x):
+                return x
+
+            identity(Payload())
+            self.assertEqual(0, Payload.str_num)
+
+            @log_function_info(input_level="INFO", result_level="DEBUG", max_bytes=10)
+            def echo(x, **kwargs):
+                return x
+
+            echo(Payload())
+            self.assertEqual(["INFO", "DEBUG"], [r["level"].name for r in records])
+            self.assertNotIn("x" * 11, records[0]["message"])
+            self.assertNotIn("x" * 11, records[1]["message"])
+
+            # 设置max_bytes后超大的参数不会被完整格式化
+            Payload.str_num = 0
+            records.clear()
+            echo([Payload() for _ in range(10000)], text="y" * 1000000, data=b"z" * 1000000)
+            self.assertLess(Payload.str_num, 10)
+            self.assertIn("truncated", records[0]["message"])
+            self.assertLess(len(records[0]["message"]), 100)
+
+            # 按utf8编码后的字节数截断
+            records.clear()
+            echo("中文" * 100)
+            result_msg = records[1]["message"].split("\n", 1)[1]
+            self.assertTrue(result_msg.endswith("...[truncated]"))
+            self.assertLessEqual(len(result_msg.removesuffix("...[truncated]").encode("utf8")), 10)
+
+            records.clear()
+
+            @log_function_info(sample_every=10)
+            def sampled_add(a, b):
+                return a + b
+
+            for i in range(100):
+                self.assertEqual(i + 1, sampled_add(i, 1))
+            self.assertEqual(20, len(records))
+
+            records.clear()
+
+            @log_function_info(result_level=None, max_per_second=5)
+            def limited_add(a, b):
+                return a + b
+
+            for i in range(100):
+                limited_add(i, 1)
+            self.assertEqual(5, len(records))
+        finally:
+            logger.remove(handler_id)
+
     async def test_async_decorator(self):
         def func(x):
             return x**2
@@ -81,12 +155,58 @@ class TestUtils(unittest.TestCase):
             rs_list.append(e)
         self.assertListEqual([3, 4, 5, 6, 7, 8, 9, 10, 11, 12], rs_list)
 
+    def test_multi_thread_streaming(self):
+        def infinite_gen():
+            i = 0
+            while True:
+                yield i
+                i += 1
+
+        fn = multi_thread(work_num=4, max_inflight=8)(add)
+        rs = list(itertools.islice(fn(data=infinite_gen(), b=1), 100))
+        self.assertListEqual(list(range(1, 101)), rs)
+
+        fn = multi_thread(work_num=4, return_list=True, ordered=False)(add)
+        rs = fn(data=range(100), b=1)
+        self.assertListEqual(list(range(1, 101)), sorted(rs))
+
+    def test_multi_async(self):
+        async def async_add(a, b=1):
+            await asyncio.sleep(random.random() / 100)
+            return a + b
+
+        fn = multi_async(work_num=16, return_list=True)(async_add)
+        rs = asyncio.run(fn(data=range(100), b=2))
+        self.assertListEqual(list(range(2, 102)), rs)
+
+        async def collect():
+            fn = multi_async(work_num=4, ordered=False, rate_limit=200)(add)
+            return [e async for e in fn(range(20))]
+
+        st = time.time()
+        rs = asyncio.run(collect())
+        self.assertListEqual(list(range(1, 21)), sorted(rs))
+        self.assertGreater(time.time() - st, 19 / 200)
+
     def test_multi_process(self):
         process_batch_fn = multi_process(work_num=4, return_list=True)(sleep_with_add)
         rs = process_batch_fn(data=[1, 2, 3, 4, 5, 6, 7, 8, 9, 10])
         logger.info(rs)
         self.assertListEqual([2, 3, 4, 5, 6, 7, 8, 9, 10, 11], rs)
 
+        process_batch_fn = multi_process(work_num=4, return_list=True)(add)
+        rs = process_batch_fn(range(1000), b=2)
+        self.assertListEqual(list(range(2, 1002)), rs)
+        rs = process_batch_fn(range(10), b=3)
+        self.assertListEqual(list(range(3, 13)), rs)
+        self.assertIs(get_process_pool(4), get_process_pool(4))
+
+        # 自动估算chunksize时所有数据都在子进程中执行
+        pids = multi_process(work_num=4, return_list=True)(get_pid)(range(20))
+        self.assertEqual(20, len(pids))
+        self.assertNotIn(os.getpid(), pids)
+        self.assertEqual([], multi_process(work_num=4, return_list=True)(get_pid)([]))
+
     def test_retry(self):
         @retry(retry_num=3, wait_time=(0.1, 0.4))
         def rand_func(a):
@@ -101,6 +221,44 @@ class TestUtils(unittest.TestCase):
             except Exception as e:
                 logger.info(e)
 
+    def test_async_retry(self):
+        calls = []
+
+        @retry(retry_num=3, wait_time=0.01, backoff=2, jitter=True, exceptions=ValueError)
+        async def flaky(a):
+            calls.append(a)
+            if len(calls) < 3:
+                raise ValueError("fail")
+            return a
+
+        self.assertEqual(1, asyncio.run(flaky(1)))
+        self.assertEqual(3, len(calls))
+
+        @retry(retry_num=3, wait_time=0.01, exceptions=ValueError)
+        def not_retryable():
+            calls.append(0)
+            raise KeyError("fail")
+
+        with self.assertRaises(KeyError):
+            not_retryable()
+        self.assertEqual(4, len(calls))
+
+    def test_retry_budget(self):
+        budget = RetryBudget(max_tokens=2, ratio=0.5)
+        calls = []
+
+        @retry(retry_num=5, wait_time=0, budget=budget)
+        def always_fail():
+            calls.append(0)
+            raise Exception("fail")
+
+        with self.assertRaises(Exception):
+            always_fail()
+        self.assertEqual(3, len(calls))
+        with self.assertRaises(Exception):
+            always_fail()
+        self.assertEqual(4, len(calls))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,90 @@
+#! /usr/bin/env python3
+# -*- coding utf-8 -*-
+"""
+-------------------------------------------------
+   File Name：     test_evaluate.py
+   Author :       agent
+   time：          2026/10/18 20:27
+   Description :
+-------------------------------------------------
+"""
+
+import random
+import unittest
+
+from snippets.evaluate import *
+
+
+# 逐个label用集合计算的参考实现，与原来的pr_statistic一致
+def naive_pr_statistic(true_sets, pred_sets):
+    labels = {e[1] for e in true_sets} | {e[1] for e in pred_sets}
+    detail_dict = {label: eval_sets({e for e in true_sets if e[1] == label}, {e for e in pred_sets if e[1] == label}) for label in labels}
+    detail_dict = dict(sorted(detail_dict.items(), key=lambda x: x[1]["f1"], reverse=True))
+    return dict(detail=detail_dict, micro=get_micro_avg(detail_dict.values()), macro=get_macro_avg(detail_dict.values()))
+
+
+def gen_data(sample_num, label_num, seed=0):
+    rd = random.Random(seed)
+    true_sets, pred_sets = [], []
+    for idx in range(sample_num):
+        true_sets.extend((idx, f"label{rd.randrange(label_num)}", rd.randrange(10)) for _ in range(rd.randrange(4)))
+        pred_sets.extend((idx, f"label{rd.randrange(label_num)}", rd.randrange(10)) for _ in range(rd.randrange(4)))
+        pred_sets.extend(e for e in true_sets[-3:] if e[0] == idx and rd.random() < 0.7)
+    return true_sets, pred_sets
+
+
+class TestEvaluate(unittest.TestCase):
+    def assert_eval_equal(self, expected, actual):
+        self.assertEqual(expected["detail"].keys(), actual["detail"].keys())
+        for label, eval_rs in expected["detail"].items():
+            for k, v in eval_rs.items():
+                self.assertAlmostEqual(v, actual["detail"][label][k], msg=f"{label}:{k}")
+        for avg in ["micro", "macro"]:
+            self.assertEqual(expected[avg].keys(), actual[avg].keys())
+            for k, v in expected[avg].items():
+                self.assertAlmostEqual(v, actual[avg][k], msg=f"{avg}:{k}")
+
+    def test_pr_statistic(self):
+        true_sets = [(0, "PER", "a"), (0, "LOC", "b"), (1, "PER", "c"), (1, "PER", "c")]
+        pred_sets = [(0, "PER", "a"), (0, "ORG", "b"), (1, "PER", "d")]
+        rs = pr_statistic(true_sets, pred_sets)
+        self.assertEqual(dict(tp=1, fp=1, fn=1, precision=0.5, recall=0.5, f1=0.5), rs["detail"]["PER"])
+        self.assertEqual(dict(tp=0, fp=0, fn=1, precision=0.0, recall=0.0, f1=0.0), rs["detail"]["LOC"])
+        self.assertEqual(dict(tp=0, fp=1, fn=0, precision=0.0, recall=0.0, f1=0.0), rs["detail"]["ORG"])
+        self.assertEqual("PER", next(iter(rs["detail"])))
+        self.assertEqual(1, rs["micro"]["tp"])
+        self.assertAlmostEqual(0.25, rs["macro"]["precision"])
+        self.assert_eval_equal(naive_pr_statistic(true_sets, pred_sets), rs)
+
+        rs = pr_statistic([], [])
+        self.assertEqual(dict(), rs["detail"])
+        self.assertEqual(0.0, rs["macro"]["f1"])
+
+    def test_streaming(self):
+        true_sets, pred_sets = gen_data(sample_num=2000, label_num=50)
+        expected = naive_pr_statistic(true_sets, pred_sets)
+        # micro/macro复用get_micro_avg/get_macro_avg，结果与原实现完全一致
+        self.assertEqual(expected, pr_statistic(true_sets, pred_sets))
+
+        # 按样本切分batch增量测评
+        evaluator = PREvaluator()
+        for start in range(0, 2000, 300):
+            evaluator.update([e for e in true_sets if start <= e[0] < start + 300], [e for e in pred_sets if start <= e[0] < start + 300])
+        self.assert_eval_equal(expected, evaluator.compute())
+
+        # 不同的evaluator分别测评后合并
+        evaluators = [PREvaluator() for _ in range(3)]
+        for idx in range(2000):
+            evaluators[idx % 3].update([e for e in true_sets if e[0] == idx], [e for e in pred_sets if e[0] == idx])
+        merged = PREvaluator().merge(evaluators[0]).merge(evaluators[1]).merge(evaluators[2])
+        self.assert_eval_equal(expected, merged.compute())
+        self.assertEqual(evaluator.compute()["micro"], merged.compute()["micro"])
+
+    def test_key(self):
+        evaluator = PREvaluator(key=lambda x: x[0])
+        rs = evaluator.update([("A", "x")], []).compute()
+        self.assertEqual(1, rs["detail"]["A"]["fn"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+#! /usr/bin/env python3
+# -*- coding utf-8 -*-
+"""
+-------------------------------------------------
+   File Name：     test_init.py
+   Author :       agent
+   time：          2026/10/18 20:18
+   Description :
+-------------------------------------------------
+"""
+
+import ast
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+import snippets
+
+HEAVY_MODULES = ["numpy", "pandas", "pydantic", "requests", "tqdm", "cachetools"]
+
+
+class TestInit(unittest.TestCase):
+    def run_python(self, code: str) -> dict:
+        output = subprocess.check_output([sys.executable, "-c", code], cwd=os.path.dirname(os.path.dirname(__file__)))
+        return json.loads(output.decode("utf8").strip().splitlines()[-1])
+
+    def test_lazy_import(self):
+        code = f"""
+import json, sys, time
+st = time.perf_counter()
+import snippets
+snippets.retry, snippets.jdumps({{"a": 1}}), snippets.multi_thread
+cost = time.perf_counter() - st
+print(json.dumps(dict(cost=cost, loaded=[m for m in {HEAVY_MODULES} if m in sys.modules])))
+"""
+        rs = self.run_python(code)
+        self.assertEqual([], rs["loaded"])
+        # 不导入numpy/pandas等重量级依赖时，import耗时应该远小于原来的数百毫秒
+        self.assertLess(rs["cost"], 0.3)
+
+    def test_lazy_attrs(self):
+        # __init__中登记的名称需要和子模块中定义的公开名称保持一致
+        package_dir = os.path.dirname(snippets.__file__)
+        for module, attrs in snippets._SUBMODULE_ATTRS.items():
+            tree = ast.parse(open(os.path.join(package_dir, module.split(".")[-1] + ".py"), encoding="utf8").read())
+            names = []
+            for node in tree.body:
+                if isinstance(node, ast.FunctionDef | ast.AsyncFunctionDef | ast.ClassDef):
+                    names.append(node.name)
+                elif isinstance(node, ast.Assign):
+                    names.extend(t.id for t in node.targets if isinstance(t, ast.Name))
+                elif isinstance(node, ast.AnnAssign) and isinstance(node.target, ast.Name):
+                    names.append(node.target.id)
+            self.assertEqual(sorted(attrs), sorted(e for e in names if not e.startswith("_")), module)
+        for attr in snippets.__all__:
+            self.assertIsNotNone(getattr(snippets, attr))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,134 @@
+#! /usr/bin/env python3
+# -*- coding utf-8 -*-
+"""
+-------------------------------------------------
+   File Name：     test_logs.py
+   Author :       agent
+   time：          2026/10/18 20:21
+   Description :
+-------------------------------------------------
+"""
+
+import os
+import tempfile
+import unittest
+
+from snippets.logs import *
+
+
+class TestLogs(unittest.TestCase):
+    def test_log_path_added_once(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            log_path = os.path.join(tmp_dir, "single.log")
+            set_logger("prod", "test_log_path_added_once", std=False, log_path=log_path)
+            logger.patch(lambda r: r.update(name="test_log_path_added_once")).info("hello")
+            with open(log_path, encoding="utf8") as f:
+                self.assertEqual(1, len([line for line in f if "hello" in line]))
+
+    def test_queued_sink(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            module_name = "test_queued_sink"
+            set_logger("prod", module_name, std=False, log_dir=tmp_dir, queued=True, batch_size=64)
+            module_logger = logger.patch(lambda r: r.update(name=module_name))
+            for i in range(1000):
+                module_logger.info(f"message {i}")
+            sinks = {k: v for k, v in queued_sinks.items() if k.startswith(module_name)}
+            self.assertEqual(2, len(sinks))
+            for sink in sinks.values():
+                sink.wait()
+            stats = {k: v for k, v in get_sink_stats().items() if k.startswith(module_name)}
+            for stat in stats.values():
+                self.assertEqual(1000, stat["written"])
+                self.assertEqual(0, stat["dropped"])
+                self.assertLess(stat["batches"], 1000)
+            with open(os.path.join(tmp_dir, "output.log"), encoding="utf8") as f:
+                self.assertEqual(1000, len(f.readlines()))
+            for key in sinks:
+                logger.remove(handlers.pop(key))
+                queued_sinks.pop(key)
+
+    def test_queued_sink_drop(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            sink = QueuedFileSink(os.path.join(tmp_dir, "drop.log"), queue_size=1, overflow="drop")
+            for i in range(1000):
+                sink.write(f"message {i}\n")
+            sink.stop()
+            stats = sink.stats()
+            self.assertEqual(1000, stats["enqueued"] + stats["dropped"])
+            self.assertEqual(stats["enqueued"], stats["written"])
+
+    def test_log_router(self):
+        log_router = LogRouter()
+        log_router.register("module", "snippets.utils")
+        log_router.register("function", None, "jload")
+        log_router.register("both", "snippets", "jload")
+        self.assertEqual({"module", "function", "both"}, log_router.match("snippets.utils", "jload_lines"))
+        self.assertEqual({"module"}, log_router.match("snippets.utils", "dump"))
+        self.assertEqual(frozenset(), log_router.match("other", "dump"))
+        self.assertEqual(3, log_router.cache_size())
+
+        module_filter = log_router.get_filter("module")
+        self.assertTrue(module_filter(dict(name="snippets.utils", function="dump")))
+        self.assertFalse(module_filter(dict(name="other", function="dump")))
+
+        log_router.unregister("module", "snippets.utils")
+        self.assertEqual(0, log_router.cache_size())
+        self.assertFalse(module_filter(dict(name="snippets.utils", function="dump")))
+        self.assertEqual({"function"}, log_router.match("other.module", "jload"))
+
+    def test_log_router_matches_once_per_record(self):
+        log_router = LogRouter()
+        match_num = 0
+        origin_match = log_router.match
+
+        def counted_match(name, function):
+            nonlocal match_num
+            match_num += 1
+            return origin_match(name, function)
+
+        log_router.match = counted_match
+        messages = []
+        handler_ids = []
+        for target in range(3):
+            log_router.register(target, __name__)
+            handler_ids.append(logger.add(messages.append, format="{message}", filter=log_router.get_filter(target)))
+        try:
+            for i in range(10):
+                logger.info(f"message {i}")
+            # 多个handler共享同一条record，每条日志只计算一次路由
+            self.assertEqual(10, match_num)
+            self.assertEqual(30, len(messages))
+        finally:
+            for handler_id in handler_ids:
+                logger.remove(handler_id)
+
+    def test_shared_handler(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            log_path = os.path.join(tmp_dir, "shared.log")
+            module_names = [f"test_shared_handler{i}" for i in range(12)]
+            keys = [f"{module_name}_file_INFO_{log_path}" for module_name in module_names]
+            try:
+                for module_name in module_names:
+                    set_logger("prod", module_name, std=False, log_path=log_path)
+                # 相同sink以及参数的12个module共用一个loguru handler，每条日志只经过一次filter
+                self.assertEqual(1, len({handlers[key] for key in keys}))
+                logger.patch(lambda r: r.update(name="test_shared_handler3")).info("hello")
+                logger.patch(lambda r: r.update(name="other")).info("ignored")
+
+                # 修改其中一个module的level时拆分出单独的handler，不影响其他module
+                with ChangeLogLevelContext(module_names[0], "file_INFO_" + log_path, "WARNING"):
+                    self.assertEqual(2, len({handlers[key] for key in keys}))
+                    logger.patch(lambda r: r.update(name=module_names[0])).info("filtered")
+                    logger.patch(lambda r: r.update(name=module_names[1])).info("world")
+            finally:
+                for handler_id in {handlers.pop(key) for key in keys}:
+                    logger.remove(handler_id)
+            with open(log_path) as f:
+                lines = f.readlines()
+            self.assertEqual(2, len(lines))
+            self.assertIn("hello", lines[0])
+            self.assertIn("world", lines[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
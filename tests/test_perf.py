@@ -0,0 +1,189 @@
+#! /usr/bin/env python3
+# -*- coding utf-8 -*-
+"""
+-------------------------------------------------
+   File Name：     test_perf.py
+   Author :       agent
+   time：          2026/10/18 20:04
+   Description :
+-------------------------------------------------
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from snippets.logs import set_logger
+from snippets.perf import *
+from snippets.utils import *
+
+logger = set_logger("dev", __name__)
+
+
+class EchoHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    connections = set()
+
+    def do_POST(self):
+        EchoHandler.connections.add(self.client_address)
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.path.endswith("/error"):
+            self.send_response(500)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        content = json.dumps(dict(data=json.loads(body))).encode("utf8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestPerf(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), EchoHandler)
+        cls.url = f"http://127.0.0.1:{cls.server.server_address[1]}/echo"
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def test_req_http_service_detail(self):
+        EchoHandler.connections.clear()
+        for i in range(5):
+            rs = req_http_service_detail(dict(idx=i), self.url)
+            self.assertEqual(dict(idx=i), rs["resp"])
+        # 同一个线程复用同一个连接
+        self.assertEqual(1, len(EchoHandler.connections))
+
+    def test_latency_stats(self):
+        values = [i / 1000 for i in range(1, 1001)]
+        stats = LatencyStats()
+        for v in values[:500]:
+            stats.record(v)
+        other = LatencyStats()
+        for v in values[500:]:
+            other.record(v)
+        other.record_error(ValueError("fail"))
+        stats.merge(LatencyStats.from_dict(other.to_dict(with_histogram=True)))
+
+        rs = stats.to_dict()
+        self.assertEqual(1000, rs["count"])
+        self.assertEqual(dict(ValueError=1), rs["errors"])
+        self.assertAlmostEqual(0.5005, rs["mean"])
+        self.assertAlmostEqual(float(np.std(values)), rs["std"])
+        self.assertEqual((0.001, 1.0), (rs["min"], rs["max"]))
+        for q in [50, 90, 99]:
+            self.assertAlmostEqual(q / 100, stats.percentile(q), delta=q / 100 * 0.01)
+
+    def test_perf_test(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            input_path = os.path.join(tmp_dir, "input.jsonl")
+            dump([dict(idx=i) for i in range(20)], input_path)
+            output_path = os.path.join(tmp_dir, "output.jsonl")
+            rs, stat = perf_test(input_path, self.url, req_http_service_detail, output_path=output_path, work_num=4)
+            self.assertEqual(20, len(rs))
+            self.assertEqual(20, stat["count"])
+            self.assertGreater(stat["p99"], 0)
+
+            records = load(output_path)
+            self.assertEqual(21, len(records))
+            self.assertEqual(stat["p99"], records[-1]["summary"]["p99"])
+
+            rs, stat = perf_test(
+                input_path, self.url + "/error", req_http_service_detail, output_path=output_path, log_interval=0.01, keep_results=False
+            )
+            self.assertIsNone(rs)
+            self.assertEqual(dict(HTTPError=20), stat["errors"])
+            self.assertEqual("HTTPError", load(output_path)[0]["error"])
+
+    def test_perf_test_interrupted(self):
+        call_num = 0
+
+        def interrupted_req(item, url):
+            nonlocal call_num
+            call_num += 1
+            if call_num > 5:
+                raise KeyboardInterrupt()
+            return req_http_service_detail(item, url)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            input_path = os.path.join(tmp_dir, "input.jsonl")
+            dump([dict(idx=i) for i in range(20)], input_path)
+            output_path = os.path.join(tmp_dir, "output.jsonl")
+            with self.assertRaises(KeyboardInterrupt):
+                perf_test(input_path, self.url, interrupted_req, output_path=output_path, work_num=1)
+            # 中断前的结果以及汇总都已经写入文件
+            records = load(output_path)
+            self.assertEqual(6, len(records))
+            self.assertEqual(5, records[-1]["summary"]["count"])
+            self.assertFalse(records[-1]["summary"]["completed"])
+
+    def test_perf_recorder_flush(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output_path = os.path.join(tmp_dir, "output.jsonl")
+            recorder = PerfRecorder(output_path, log_interval=None, flush_interval=0.05)
+            for i in range(3):
+                recorder.record(dict(idx=i, cost=0.1), 0.1)
+            time.sleep(0.3)
+            # 不足一批的结果也会按时间写入文件
+            self.assertEqual(3, len(load(output_path)))
+            recorder.close(dict(count=3))
+            self.assertEqual(dict(count=3), load(output_path)[-1]["summary"])
+
+    def test_iter_send_times(self):
+        send_times = list(iter_send_times(rate=10, duration=2))
+        self.assertEqual(20, len(send_times))
+        self.assertAlmostEqual(0.1, send_times[1] - send_times[0])
+        self.assertEqual(5, len(list(iter_send_times(rate=10, arrival="poisson", max_num=5))))
+        send_times = list(iter_send_times(rate=ramp_profile(10, 100, duration=2, step_num=2)))
+        self.assertEqual(110, len(send_times))
+        self.assertLess(send_times[-1], 2)
+
+    def test_open_loop_perf_test(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            input_path = os.path.join(tmp_dir, "input.jsonl")
+            dump([dict(idx=i) for i in range(5)], input_path)
+            st = time.time()
+            rs, stat = open_loop_perf_test(input_path, self.url, req_http_service_detail, rate=50, duration=1)
+            self.assertGreaterEqual(time.time() - st, 0.98)
+            self.assertEqual(50, stat["count"])
+            self.assertEqual(50, len(rs))
+            self.assertGreaterEqual(stat["p50"], stat["service"]["min"])
+
+    def test_mann_whitney_u(self):
+        x = np.arange(20, dtype=np.float64)
+        self.assertAlmostEqual(1.0, mann_whitney_u(x, x))
+        self.assertLess(mann_whitney_u(x, x + 10), 0.01)
+
+    def test_compare_perf_results(self):
+        rng = np.random.default_rng(1)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            paths = []
+            for name, scale, qps in [("base", 1.0, 100), ("same", 1.0, 101), ("slow", 1.5, 70)]:
+                path = os.path.join(tmp_dir, f"{name}.jsonl")
+                records = [dict(cost=float(e)) for e in rng.lognormal(0, 0.3, 500) * scale]
+                dump(records + [dict(summary=dict(qps=qps))], path)
+                paths.append(path)
+            same, slow = compare_perf_results(paths[0], paths[1:], metrics=("mean", "p50", "p999"))
+            self.assertFalse(same["regression"])
+            self.assertTrue(slow["regression"])
+            self.assertTrue(slow["qps_regression"])
+            self.assertAlmostEqual(0.5, slow["metrics"]["p50"]["change"], delta=0.15)
+            self.assertLess(slow["metrics"]["p50"]["ci_low"], slow["metrics"]["p50"]["change"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+#! /usr/bin/env python3
+# -*- coding utf-8 -*-
+"""
+-------------------------------------------------
+   File Name：     test_spans.py
+   Author :       agent
+   time：          2026/10/18 20:16
+   Description :
+-------------------------------------------------
+"""
+
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from snippets.decorators import LogCostContext
+from snippets.logs import set_logger
+from snippets.spans import *
+
+logger = set_logger("dev", __name__)
+
+
+class TestSpans(unittest.TestCase):
+    def setUp(self):
+        set_tracer(Tracer())
+
+    def test_nested_spans(self):
+        @trace_span("inner")
+        def inner():
+            time.sleep(0.01)
+
+        with span("outer", stage="test") as outer:
+            for _ in range(3):
+                inner()
+            with LogCostContext("log_cost", record_span=True):
+                inner()
+            # 默认不记录span
+            with LogCostContext("log_cost_without_span"):
+                inner()
+
+        spans = {(e.name, e.span_id): e for e in get_tracer().spans}
+        inner_spans = [e for (name, _), e in spans.items() if name == "inner"]
+        self.assertEqual(5, len(inner_spans))
+        self.assertNotIn("log_cost_without_span", [name for name, _ in spans])
+        # 没有记录span的LogCostContext中的inner直接挂在outer下
+        self.assertEqual(4, len([e for e in inner_spans if e.parent_id == outer.span_id]))
+        log_cost_span = [e for (name, _), e in spans.items() if name == "log_cost"][0]
+        self.assertEqual(outer.span_id, log_cost_span.parent_id)
+
+        aggregate = get_tracer().aggregate()
+        self.assertEqual(5, aggregate["inner"]["count"])
+        self.assertGreaterEqual(aggregate["outer"]["total"], aggregate["inner"]["total"])
+        self.assertAlmostEqual(0.01, aggregate["inner"]["p50"], delta=0.005)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            trace = get_tracer().to_chrome_trace(os.path.join(tmp_dir, "trace.json"))
+            self.assertEqual(7, len(trace["traceEvents"]))
+            self.assertTrue(os.path.exists(os.path.join(tmp_dir, "trace.json")))
+
+    def test_threads_and_tasks(self):
+        @trace_span()
+        async def work(i):
+            with span("step"):
+                await asyncio.sleep(0.01)
+            return i
+
+        async def main():
+            with span("main") as main_span:
+                await asyncio.gather(*[work(i) for i in range(5)])
+            return main_span
+
+        def thread_work():
+            with span("thread"):
+                with span("thread_child"):
+                    time.sleep(0.01)
+
+        main_span = asyncio.run(main())
+        threads = [threading.Thread(target=thread_work) for _ in range(2)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        spans = list(get_tracer().spans)
+        work_spans = [e for e in spans if e.name.endswith("work")]
+        self.assertEqual(5, len(work_spans))
+        self.assertTrue(all(e.parent_id == main_span.span_id for e in work_spans))
+        work_ids = {e.span_id for e in work_spans}
+        self.assertTrue(all(e.parent_id in work_ids for e in spans if e.name == "step"))
+        thread_spans = {e.span_id: e for e in spans if e.name == "thread"}
+        for e in spans:
+            if e.name == "thread_child":
+                self.assertEqual(e.thread_id, thread_spans[e.parent_id].thread_id)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -9,8 +9,15 @@
 -------------------------------------------------
 """
 
+import math
+import sys
+import tempfile
 import unittest
 from time import sleep
+from unittest import mock
+
+import pandas as pd
+from pydantic import BaseModel
 
 from snippets.logs import set_logger
 from snippets.utils import *
@@ -24,6 +31,21 @@ class TestUtils(unittest.TestCase):
         val_str = jdumps(val)
         logger.info(val_str)
 
+    def test_jloads(self):
+        s = '{"a": [1, 2.5, {"b": null}], "c": "中文"}'
+        self.assertEqual(jloads(s), jloads(s, fast=False))
+        self.assertTrue(math.isnan(jloads('{"a": NaN}')["a"]))
+        obj = {"x": {"_python_object": str(pickle.dumps({1, 2}))}}
+        self.assertEqual({"x": {1, 2}}, jloads(json.dumps(obj)))
+        # bytes以及"rb"模式打开的文件
+        self.assertEqual(jloads(s), jloads(s.encode("utf8")))
+        self.assertEqual({"x": {1, 2}}, jloads(json.dumps(obj).encode("utf8")))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "data.json")
+            jdump(dict(a=1, b="中文"), path)
+            with open(path, mode="rb") as f:
+                self.assertEqual(dict(a=1, b="中文"), jload(f))
+
     def test_groupby(self):
         seq = [1, 1, 1, 2, 2, 3, 5, 5, 5, 1]
         g = groupby(seq, map_func=lambda x: x**2)
@@ -72,6 +94,114 @@ class TestUtils(unittest.TestCase):
         logger.info(len(data))
         self.assertEqual(len(data), 6)
 
+    def test_parallel_jload_lines(self):
+        data = [dict(idx=i, text="x" * (i % 7)) for i in range(1000)]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "data.jsonl")
+            jdump_lines(data, path)
+            self.assertEqual(data, jload_lines(path, work_num=4))
+            self.assertEqual(data[:10], jload_lines(path, work_num=4, chunk_num=50, max_data_num=10))
+            gen = jload_lines(path, work_num=2, return_generator=True)
+            self.assertEqual(data, list(gen))
+
+    def test_parallel_jload_lines_unicode_separators(self):
+        # ensure_ascii=False时这些字符不会被转义，但是都会被str.splitlines()当作换行符
+        separators = ["\x85", "\u2028", "\u2029", "\x0b", "\x0c", "\x1c", "\x1d", "\x1e"]
+        data = [dict(idx=i, text=f"a{separators[i % len(separators)]}b") for i in range(100)]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "data.jsonl")
+            jdump_lines(data, path)
+            self.assertEqual(data, jload_lines(path))
+            self.assertEqual(data, jload_lines(path, work_num=2))
+
+    def test_jsonl_writer(self):
+        data = [dict(idx=i, s={i}, d=datetime(2024, 1, 1)) for i in range(25)]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for background in [False, True]:
+                path = os.path.join(tmp_dir, f"{background}.jsonl")
+                with JsonlWriter(path, buffer_size=10, background=background) as writer:
+                    writer.write(data[0])
+                    writer.write_many(data[1:])
+                    writer.flush()
+                    self.assertEqual(25, len(jload_lines(path)))
+                expected = [json.loads(jdumps(e, indent=None)) for e in data]
+                self.assertEqual(expected, jload_lines(path))
+
+    def test_compressed_load(self):
+        data = [dict(idx=i, text="中文") for i in range(10)]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for compression in [".gz", ".bz2", ".xz"]:
+                path = os.path.join(tmp_dir, f"data.jsonl{compression}")
+                dump(data, path)
+                self.assertEqual(data, load(path))
+                self.assertEqual(data[:3], load(path, max_data_num=3))
+
+                path = os.path.join(tmp_dir, f"data.txt{compression}")
+                dump(["a", "b"], path)
+                self.assertEqual(["a", "b"], load(path))
+
+    def test_jsonl_index(self):
+        data = [dict(idx=i) for i in range(100)]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "data.jsonl")
+            jdump_lines(data, path)
+            index = JsonlIndex(path)
+            self.assertEqual(100, len(index))
+            self.assertEqual(data[42], index.get(42))
+            self.assertEqual(data[-1], index[-1])
+            self.assertEqual(data[10:20], index.slice(10, 20))
+            self.assertEqual(data[95:], index[95:])
+            self.assertTrue(os.path.exists(index.index_path))
+
+            data.append(dict(idx=100))
+            jdump_lines(data[-1:], path, mode="a")
+            # 追加后没有重建的索引只返回建索引时的数据
+            self.assertEqual(100, len(index))
+            self.assertEqual(data[98:100], index.slice(98, 100))
+            self.assertEqual(data[95:100], index[95:])
+            index = JsonlIndex(path)
+            self.assertEqual(101, len(index))
+            self.assertEqual(data[-1], index.get(100))
+
+    def test_jsonl_index_chunked_build(self):
+        data = [dict(idx=i, text=f"a{sep}b") for i, sep in enumerate(["\u2028", "\x85", "\x0c", ""] * 25)]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "data.jsonl")
+            jdump_lines(data, path)
+            with mock.patch.object(JsonlIndex, "BUILD_CHUNK_SIZE", 7):
+                index = JsonlIndex(path)
+            self.assertEqual(100, len(index))
+            self.assertEqual(data[0], index.get(0))
+            self.assertEqual(data[:2], index.slice(0, 2))
+            self.assertEqual(data, index[:])
+            self.assertEqual([os.path.basename(index.index_path)], [e for e in os.listdir(tmp_dir) if e.startswith("data.jsonl.")])
+
+    def test_iter_load(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for i in range(5):
+                dump([dict(shard=i, idx=j) for j in range(10)], os.path.join(tmp_dir, f"part-{i}.jsonl"))
+            pattern = os.path.join(tmp_dir, "part-*.jsonl")
+            self.assertEqual(50, len(list(iter_load(pattern))))
+            self.assertEqual(23, len(list(iter_load(pattern, max_data_num=23))))
+            paths = sorted(glob.glob(pattern))
+            self.assertEqual(load(paths), list(iter_load(paths, prefetch_num=2)))
+            self.assertEqual(load(paths)[:15], list(iter_load(paths, max_data_num=15, prefetch_num=2)))
+
+    def test_table_load(self):
+        data = [dict(a=i, b=f"b{i}", c=None if i % 2 else i / 2) for i in range(10)]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            csv_path = os.path.join(tmp_dir, "data.csv.gz")
+            dump(data, csv_path)
+            self.assertEqual(data, load(csv_path))
+            self.assertEqual(data, load(csv_path, chunksize=3))
+            columns = table2json(csv_path, orient="columns")
+            self.assertEqual(list(range(10)), columns["a"].tolist())
+            self.assertIsInstance(table2json(csv_path, orient="dataframe"), pd.DataFrame)
+            for suffix in [".parquet", ".feather", ".arrow"]:
+                path = os.path.join(tmp_dir, f"data{suffix}")
+                dump(columns, path)
+                self.assertEqual(data, load(path))
+
     def test_cache_load(self):
         file_path = "data/sample.jsonl"
         data = load_with_cache(file_path)
@@ -80,6 +210,64 @@ class TestUtils(unittest.TestCase):
         data = load_with_cache(file_path)
         logger.info(len(data))
 
+    def test_load_cache(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            paths = []
+            for i in range(3):
+                path = os.path.join(tmp_dir, f"{i}.jsonl")
+                dump([dict(text="x" * 1000) for _ in range(100)], path)
+                paths.append(path)
+            size = estimate_size(load(paths[0]))
+            cache = LoadCache(max_bytes=int(size * 2.5), cache_dir=os.path.join(tmp_dir, "cache"))
+            for path in paths:
+                load_with_cache(path, cache=cache)
+            load_with_cache(paths[2], cache=cache)
+            stats = cache.stats()
+            self.assertEqual(1, stats["hits"])
+            self.assertEqual(3, stats["misses"])
+            self.assertEqual(1, stats["evictions"])
+            self.assertLessEqual(stats["current_bytes"], stats["max_bytes"])
+
+            disk_cache = LoadCache(cache_dir=os.path.join(tmp_dir, "cache"))
+            self.assertEqual(load(paths[0]), load_with_cache(paths[0], cache=disk_cache))
+            self.assertEqual(1, disk_cache.stats()["disk_hits"])
+
+    def test_shared_cache_load(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache_dir = os.path.join(tmp_dir, "cache")
+            for file_path, data in [("data.jsonl", [dict(a=i, b=str(i)) for i in range(10)]), ("data.txt", ["a", "b", "c"])]:
+                file_path = os.path.join(tmp_dir, file_path)
+                dump(data, file_path)
+                self.assertEqual(data, load_with_shared_cache(file_path, cache_dir=cache_dir, return_type="list"))
+                self.assertEqual(len(data), load_with_shared_cache(file_path, cache_dir=cache_dir).num_rows)
+            self.assertEqual(2, len(glob.glob(os.path.join(cache_dir, "*.arrow"))))
+            self.assertEqual([], glob.glob(os.path.join(cache_dir, "*.lock")))
+
+    def test_shared_cache_load_heterogeneous(self):
+        cases = [
+            ("keys.jsonl", [dict(a=1), dict(b=2), dict(a=3, b=None)]),
+            ("types.jsonl", [dict(a=1), dict(a="x")]),
+            ("nested.jsonl", [dict(a=dict(x=1)), dict(a=dict(y=2))]),
+            ("values.jsonl", [1, "x", [1, 2]]),
+            ("object.json", dict(a=[1, 2], b="中文")),
+        ]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache_dir = os.path.join(tmp_dir, "cache")
+            for file_path, data in cases:
+                file_path = os.path.join(tmp_dir, file_path)
+                dump(data, file_path)
+                self.assertEqual(load(file_path), load_with_shared_cache(file_path, cache_dir=cache_dir, return_type="list"), file_path)
+            table = load_with_shared_cache(os.path.join(tmp_dir, "keys.jsonl"), cache_dir=cache_dir)
+            self.assertEqual(["a", "b"], table.column_names)
+            self.assertEqual([1, None, 3], table.column("a").to_pylist())
+
+            # 没有fcntl的平台使用O_EXCL锁文件
+            with mock.patch.dict(sys.modules, {"fcntl": None}):
+                file_path = os.path.join(tmp_dir, "no_fcntl.jsonl")
+                dump([dict(a=1)], file_path)
+                self.assertEqual([dict(a=1)], load_with_shared_cache(file_path, cache_dir=cache_dir, return_type="list"))
+            self.assertEqual([], glob.glob(os.path.join(cache_dir, "*.lock")))
+
     def test_batch_process_with_save(self):
         data = range(20)
 